@@ -1,34 +1,153 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
+from config.app_config import configure_logging, init_json, init_request_limits, limit_body, cached_page_view
 import os
 import logging
-import base64
 import json
 
+# pybase64 is a SIMD-accelerated drop-in for the stdlib module
+try:
+    import pybase64 as base64
+    _b64encode_str = base64.b64encode_as_string
+except ImportError:
+    import base64
+
+    def _b64encode_str(data):
+        return base64.b64encode(data).decode('ascii')
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# gzip for the Markdown answers when Flask-Compress is installed
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+
+# Literal needles for the codebase overview, mapped to the flag they set
+_CODEBASE_MARKERS = {
+    'import React': 'react',
+    'from "react"': 'react',
+    '.ts': 'typescript',  # also matches .tsx
+    'useState': 'hooks',
+    'useEffect': 'hooks',
+    'function ': 'components',
+    'const ': 'components',
+}
+_CODEBASE_FLAGS = frozenset(_CODEBASE_MARKERS.values())
+
+# pyahocorasick finds every marker in one C-level pass over the codebase
+try:
+    import ahocorasick
+    _MARKER_AUTOMATON = ahocorasick.Automaton()
+    for _needle, _flag in _CODEBASE_MARKERS.items():
+        _MARKER_AUTOMATON.add_word(_needle, _flag)
+    _MARKER_AUTOMATON.make_automaton()
+except ImportError:
+    _MARKER_AUTOMATON = None
+
 # Create Flask app
 app = Flask(__name__, static_folder='static')
 CORS(app)
+init_json(app)
+init_request_limits(app)
+if Compress is not None:
+    Compress(app)
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Static insight sections for /ask, selected by the query topic. They are
+# pre-encoded so only the per-request parts of the report go through UTF-8
+# encoding
+USE_EFFECT_INSIGHT = """
+- ⚠️ **useEffect Issues:** Common causes of infinite re-renders:
+  1. Missing dependency array
+  2. Objects/functions in dependency array
+  3. State updates triggering the effect
+  
+- 💡 **Solutions:**
+  - Use useCallback for function dependencies
+  - Use useMemo for object dependencies
+  - Split effects by concern""".encode('utf-8')
+
+USE_STATE_INSIGHT = """
+- 📦 **useState Best Practices:**
+  1. Don't call setState in render
+  2. Use functional updates for counters
+  3. Group related state together
+  
+- 🔄 **State Updates:**
+  - setState is asynchronous
+  - Use functional form: setState(prev => prev + 1)""".encode('utf-8')
+
+PERFORMANCE_INSIGHT = """
+- 🚀 **Performance Tips:**
+  1. Use React.memo for expensive components
+  2. Implement useMemo for heavy calculations
+  3. Use useCallback for event handlers
+  4. Consider code-splitting with lazy loading""".encode('utf-8')
+
+TYPESCRIPT_INSIGHT = """
+- 🛡️ **TypeScript in React:**
+  1. Define proper interfaces for props
+  2. Use union types for state
+  3. Type your event handlers
+  4. Leverage generic components""".encode('utf-8')
+
+HOOKS_FRAGMENT = {True: 'Using modern hooks ✅', False: 'Consider upgrading to hooks'}
+TYPESCRIPT_FRAGMENT = {True: 'Already using TS ✅', False: 'Consider adding TypeScript'}
+
+# "Related Files Analyzed" lines for 0-10 files, indexed by file count
+RELATED_FILES = tuple(', '.join(f"File {i+1}" for i in range(n)) for n in range(11))
+
+def encode_answer(text):
+    """Base64-encode an answer straight to a str in a single pass"""
+    return _b64encode_str(text.encode('utf-8'))
+
+def wants_raw_answer():
+    """Clients that send ?raw=1 get the answer as plain UTF-8 text instead
+    of the base64 envelope"""
+    return request.args.get('raw') == '1'
+
+def scan_codebase(codebase):
+    """Return the set of overview flags whose markers appear in the codebase"""
+    if _MARKER_AUTOMATON is None:
+        return {flag for needle, flag in _CODEBASE_MARKERS.items() if needle in codebase}
+
+    found = set()
+    for _, flag in _MARKER_AUTOMATON.iter(codebase):
+        found.add(flag)
+        if len(found) == len(_CODEBASE_FLAGS):
+            break
+    return found
+
+# The main page is read once at startup and served from memory
+serve_index = cached_page_view(app, 'index.html')
+
 @app.route('/')
 def index():
     """Serve the main HTML page"""
-    return send_from_directory('static', 'index.html')
+    return serve_index()
 
 @app.route('/ask', methods=['POST'])
+@limit_body()
 def ask():
     """Simple text-based RAG endpoint"""
     try:
-        data = request.get_json()
+        # Parse the raw body directly without keeping a cached copy of it
+        # alongside the decoded codebase
+        data = _json_loads(request.get_data(cache=False))
         query = data.get("query", "")
         codebase = data.get("codebase", "")
         obfuscated = data.get("obfuscated", "You are a helpful senior software developer assistant.")
         
-        logger.info(f"Processing query: {query}")
-        logger.info(f"Codebase length: {len(codebase)} characters")
+        logger.info("Processing query: %s", query)
+        logger.info("Codebase length: %d characters", len(codebase))
         
         if not query:
             return jsonify({'error': 'Query is required'}), 400
@@ -38,13 +157,14 @@ def ask():
         
         # Simple codebase analysis
         file_count = codebase.count('/////////')
-        has_react = 'import React' in codebase or 'from "react"' in codebase
-        has_typescript = '.tsx' in codebase or '.ts' in codebase
-        has_hooks = 'useState' in codebase or 'useEffect' in codebase
-        has_components = 'function ' in codebase or 'const ' in codebase
+        flags = scan_codebase(codebase)
+        has_react = 'react' in flags
+        has_typescript = 'typescript' in flags
+        has_hooks = 'hooks' in flags
+        has_components = 'components' in flags
         
-        # Create analysis result
-        result = f"""## 🚀 React Code Analysis
+        # Create analysis result; encoded sections are collected and joined once
+        parts = [f"""## 🚀 React Code Analysis
 
 **Your Query:** {query}
 
@@ -60,77 +180,53 @@ def ask():
 {obfuscated}
 
 **📝 Quick Insights:**
-"""
+""".encode('utf-8')]
 
-        # Add specific insights based on query
-        if 'useeffect' in query.lower() or 'effect' in query.lower():
-            result += """
-- ⚠️ **useEffect Issues:** Common causes of infinite re-renders:
-  1. Missing dependency array
-  2. Objects/functions in dependency array
-  3. State updates triggering the effect
-  
-- 💡 **Solutions:**
-  - Use useCallback for function dependencies
-  - Use useMemo for object dependencies
-  - Split effects by concern"""
+        # Add specific insights based on query; 'useeffect', 'usestate' and
+        # 'typescript' are covered by their shorter needles
+        query_lower = query.lower()
+        if 'effect' in query_lower:
+            parts.append(USE_EFFECT_INSIGHT)
 
-        elif 'usestate' in query.lower() or 'state' in query.lower():
-            result += """
-- 📦 **useState Best Practices:**
-  1. Don't call setState in render
-  2. Use functional updates for counters
-  3. Group related state together
-  
-- 🔄 **State Updates:**
-  - setState is asynchronous
-  - Use functional form: setState(prev => prev + 1)"""
+        elif 'state' in query_lower:
+            parts.append(USE_STATE_INSIGHT)
 
-        elif 'performance' in query.lower() or 'slow' in query.lower():
-            result += """
-- 🚀 **Performance Tips:**
-  1. Use React.memo for expensive components
-  2. Implement useMemo for heavy calculations
-  3. Use useCallback for event handlers
-  4. Consider code-splitting with lazy loading"""
+        elif 'performance' in query_lower or 'slow' in query_lower:
+            parts.append(PERFORMANCE_INSIGHT)
 
-        elif 'typescript' in query.lower() or 'type' in query.lower():
-            result += """
-- 🛡️ **TypeScript in React:**
-  1. Define proper interfaces for props
-  2. Use union types for state
-  3. Type your event handlers
-  4. Leverage generic components"""
+        elif 'type' in query_lower:
+            parts.append(TYPESCRIPT_INSIGHT)
 
         else:
-            result += f"""
+            parts.append(f"""
 Based on your {file_count} files, here are general recommendations:
 
 - 🧹 **Code Organization:** Structure components by feature
-- 📱 **React Patterns:** {'Using modern hooks ✅' if has_hooks else 'Consider upgrading to hooks'}
-- 🔧 **TypeScript:** {'Already using TS ✅' if has_typescript else 'Consider adding TypeScript'}
+- 📱 **React Patterns:** {HOOKS_FRAGMENT[has_hooks]}
+- 🔧 **TypeScript:** {TYPESCRIPT_FRAGMENT[has_typescript]}
 - 🎯 **Best Practices:** Keep components small and focused
 
-**💡 Pro Tip:** Your specific query "{query}" - try asking about specific patterns, errors, or concepts!"""
+**💡 Pro Tip:** Your specific query "{query}" - try asking about specific patterns, errors, or concepts!""".encode('utf-8'))
 
-        result += f"""
+        parts.append(f"""
 
 **🔗 Related Files Analyzed:**
-{', '.join([f"File {i+1}" for i in range(min(file_count, 10))])}
+{RELATED_FILES[min(file_count, 10)]}
 {'...' if file_count > 10 else ''}
 
 ---
-*Analysis complete! Your code is processed locally and securely.* 🔒"""
+*Analysis complete! Your code is processed locally and securely.* 🔒""".encode('utf-8'))
 
-        # Base64 encode the response
-        encoded = base64.b64encode(result.encode()).decode()
-        return jsonify({"answer": encoded})
+        # Base64 encode the response unless raw text was requested
+        answer = b''.join(parts)
+        if wants_raw_answer():
+            return jsonify({"answer": answer.decode('utf-8')})
+        return jsonify({"answer": _b64encode_str(answer)})
         
     except Exception as e:
-        logger.error(f"Error: {str(e)}")
+        logger.error("Error: %s", e)
         result = f"❌ Error processing your request: {str(e)}"
-        encoded = base64.b64encode(result.encode()).decode()
-        return jsonify({"answer": encoded}), 500
+        return jsonify({"answer": result if wants_raw_answer() else encode_answer(result)}), 500
 
 @app.route('/health')
 def health_check():
@@ -142,5 +238,5 @@ if __name__ == '__main__':
     os.makedirs('static', exist_ok=True)
     os.makedirs('logs', exist_ok=True)
     
-    # Run the app
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Development server only; serve with gunicorn -c gunicorn.conf.py in production
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False)
\ No newline at end of file
@@ -1,29 +1,61 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from config.app_config import configure_logging, init_json, init_request_limits, limit_body, cached_page_view, CircuitBreaker
 import os
 import logging
 import base64
 import json
-import uuid
+import secrets
+import importlib.util
+import httpx
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Hosted Cursor AI endpoint and a shared client so pooled keep-alive
+# connections are reused across proxied requests (over HTTP/2 when h2 is
+# installed). Connect failures are retried and fail fast; reads allow for
+# a full test generation
+CURSOR_PROXY_URL_SETTING = os.getenv('CURSOR_PROXY_URL')
+CURSOR_PROXY_URL = CURSOR_PROXY_URL_SETTING or 'https://your-cursor-ai.onrender.com'
+cursor_client = httpx.Client(
+    base_url=CURSOR_PROXY_URL,
+    transport=httpx.HTTPTransport(
+        http2=importlib.util.find_spec('h2') is not None,
+        retries=int(os.getenv('CURSOR_PROXY_RETRIES', 2)),
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=10)
+    ),
+    timeout=httpx.Timeout(120, connect=3)
+)
+
+# Stop calling the hosted service for a cooldown after repeated failures so
+# an outage fails fast instead of holding workers on timeouts
+cursor_breaker = CircuitBreaker(
+    fail_max=int(os.getenv('CURSOR_BREAKER_FAIL_MAX', 3)),
+    reset_timeout=int(os.getenv('CURSOR_BREAKER_RESET_TIMEOUT', 60))
+)
+
 # Create Flask app
 app = Flask(__name__, static_folder='static', static_url_path='')
 CORS(app)
+init_json(app)
+init_request_limits(app)
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# The docs page is read once at startup and served from memory
+serve_main_docs = cached_page_view(app, 'main_docs.html')
+
 @app.route('/')
 def index():
     """Serve the main documentation page"""
-    return send_from_directory('static', 'main_docs.html')
+    return serve_main_docs()
 
 @app.route('/api/smart-test', methods=['POST'])
+@limit_body()
 def smart_test_proxy():
     """Pure middleman - just proxy to hosted Cursor AI"""
     try:
@@ -31,11 +63,20 @@ def smart_test_proxy():
         component_code = data.get("component_code", "")
         action = data.get("action", "generate")
         
-        logger.info(f"Proxying request to Cursor AI - Action: {action}")
+        logger.info("Proxying request to Cursor AI - Action: %s", action)
         
         if not component_code:
             return jsonify({'error': 'Component code is required'}), 400
         
+        # Relay generated tests as Server-Sent Events when the client asks
+        # for a stream
+        if data.get("stream"):
+            return Response(
+                stream_with_context(stream_from_cursor_ai(component_code, action)),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache'}
+            )
+        
         # Pure proxy to hosted Cursor AI - no local processing
         result = proxy_to_cursor_ai(component_code, action)
         
@@ -48,38 +89,74 @@ def smart_test_proxy():
             }), 500
         
     except Exception as e:
-        logger.error(f"Proxy error: {str(e)}")
+        logger.error("Proxy error: %s", e)
         return jsonify({
             'success': False,
             'error': f"Proxy failed: {str(e)}"
         }), 500
 
-def proxy_to_cursor_ai(component_code, action):
-    """Pure proxy function - just forwards to Cursor AI"""
+def cursor_request_body(component_code, action, stream=False):
+    """JSON body for the hosted Cursor AI analyze endpoint"""
+    return {
+        'component_code': component_code,
+        'task_type': 'test_generation',
+        'action': action,
+        'session_id': secrets.token_hex(16),
+        'stream': stream
+    }
+
+def stream_from_cursor_ai(component_code, action):
+    """Pure proxy for streamed generation - relays Cursor AI's events as
+    they arrive"""
+    if not cursor_breaker.allow():
+        logger.warning("⚡ Cursor AI circuit open - skipping call")
+        yield f"data: {json.dumps({'error': 'Cursor AI service unavailable'})}\n\n"
+        return
+    
     try:
-        import requests
+        logger.info("🔄 Streaming from Cursor AI at %s", CURSOR_PROXY_URL)
         
-        # Get hosted Cursor AI URL
-        cursor_url = os.getenv('CURSOR_PROXY_URL', 'https://your-cursor-ai.onrender.com')
+        with cursor_client.stream(
+            "POST",
+            "/api/cursor/analyze",
+            json=cursor_request_body(component_code, action, stream=True)
+        ) as response:
+            if response.status_code != 200:
+                logger.warning("⚠️ Cursor AI returned %s", response.status_code)
+                if response.status_code >= 500:
+                    cursor_breaker.record_failure()
+                yield f"data: {json.dumps({'error': 'Cursor AI service unavailable'})}\n\n"
+                return
+            
+            cursor_breaker.record_success()
+            for chunk in response.iter_bytes():
+                yield chunk
         
-        logger.info(f"🔄 Forwarding to Cursor AI at {cursor_url}")
+    except Exception as e:
+        logger.warning("Cursor AI stream error: %s", e)
+        cursor_breaker.record_failure()
+        yield f"data: {json.dumps({'error': f'Proxy failed: {str(e)}'})}\n\n"
+
+def proxy_to_cursor_ai(component_code, action):
+    """Pure proxy function - just forwards to Cursor AI"""
+    if not cursor_breaker.allow():
+        logger.warning("⚡ Cursor AI circuit open - skipping call")
+        return None
+    
+    try:
+        logger.info("🔄 Forwarding to Cursor AI at %s", CURSOR_PROXY_URL)
         
         # Forward request to hosted Cursor AI
-        response = requests.post(
-            f"{cursor_url}/api/cursor/analyze",
-            json={
-                'component_code': component_code,
-                'task_type': 'test_generation',
-                'action': action,
-                'session_id': str(uuid.uuid4())
-            },
-            timeout=120,
+        response = cursor_client.post(
+            "/api/cursor/analyze",
+            json=cursor_request_body(component_code, action),
             headers={'Content-Type': 'application/json'}
         )
         
         if response.status_code == 200:
+            cursor_breaker.record_success()
             data = response.json()
-            logger.info(f"✅ Cursor AI responded successfully")
+            logger.info("✅ Cursor AI responded successfully")
             
             # Just forward the response
             return {
@@ -89,11 +166,14 @@ def proxy_to_cursor_ai(component_code, action):
                 'coverage_estimate': '90%+'
             }
         else:
-            logger.warning(f"⚠️ Cursor AI returned {response.status_code}")
+            logger.warning("⚠️ Cursor AI returned %s", response.status_code)
+            if response.status_code >= 500:
+                cursor_breaker.record_failure()
             return None
         
     except Exception as e:
-        logger.warning(f"Cursor AI proxy error: {e}")
+        logger.warning("Cursor AI proxy error: %s", e)
+        cursor_breaker.record_failure()
         return None
 
 @app.route('/health')
@@ -102,14 +182,15 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'service': 'middleman-proxy',
-        'cursor_proxy_url': os.getenv('CURSOR_PROXY_URL', 'not-configured'),
-        'mode': 'pure-proxy'
+        'cursor_proxy_url': CURSOR_PROXY_URL_SETTING or 'not-configured',
+        'mode': 'pure-proxy',
+        'cursor_circuit_open': cursor_breaker.is_open
     })
 
 if __name__ == '__main__':
     print("🎭 Starting Disguising Middleman Proxy")
     print("=====================================")
-    print(f"🔄 Cursor AI URL: {os.getenv('CURSOR_PROXY_URL', 'Not configured')}")
+    print(f"🔄 Cursor AI URL: {CURSOR_PROXY_URL_SETTING or 'Not configured'}")
     print("🎯 Mode: Pure proxy - no local processing")
     print("🕵️ All intelligence comes from Cursor AI")
     
@@ -1 +1,149 @@
- 
+"""
+Shared configuration for the Flask services
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from functools import wraps
+from flask import current_app, request, jsonify
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import RequestEntityTooLarge
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# One log line format for every service; messages use lazy %-style
+# arguments so filtered records are never formatted
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Largest request body the API endpoints accept before parsing it
+MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_BYTES', 10 * 1024 * 1024))
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, keeping Flask's default conversions
+    for types orjson can't serialize natively"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Build the jsonify response body from orjson's bytes directly,
+        skipping the decode to str and re-encode to UTF-8"""
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def configure_logging():
+    """Configure root logging at LOG_LEVEL (default INFO) with the shared format"""
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format=LOG_FORMAT)
+
+
+def init_json(app):
+    """Switch the app's JSON provider to orjson when it is installed"""
+    if orjson is not None:
+        app.json = ORJSONProvider(app)
+    return app
+
+
+def init_request_limits(app, max_bytes=MAX_REQUEST_BYTES):
+    """Have Werkzeug cap every request body at max_bytes, including chunked
+    bodies that declare no Content-Length"""
+    app.config['MAX_CONTENT_LENGTH'] = max_bytes
+    return app
+
+
+def limit_body(max_bytes=MAX_REQUEST_BYTES):
+    """Reject requests whose body is larger than max_bytes with a JSON 413
+    before the view parses it. Declared lengths are checked without reading
+    anything; chunked bodies are read here, under the app-wide
+    MAX_CONTENT_LENGTH cap, so an oversized one can't surface as an error
+    inside the view"""
+    def too_large(limit):
+        return jsonify({
+            'success': False,
+            'error': f'Request body too large (limit {limit} bytes)'
+        }), 413
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cap = current_app.config.get('MAX_CONTENT_LENGTH')
+            limit = max_bytes if cap is None else min(max_bytes, cap)
+            if request.content_length is not None:
+                if request.content_length > limit:
+                    return too_large(limit)
+            else:
+                try:
+                    received = len(request.get_data())
+                except RequestEntityTooLarge:
+                    return too_large(limit)
+                # Werkzeug stops reading a chunked body at MAX_CONTENT_LENGTH
+                # rather than raising, so one that reaches the cap may have
+                # been cut short
+                if received > max_bytes or (cap is not None and received >= cap):
+                    return too_large(limit)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cached_page_view(app, filename, mimetype='text/html'):
+    """Read a static page once and return a view function that serves it from
+    memory, answering conditional requests with 304"""
+    with open(os.path.join(app.static_folder, filename), 'rb') as f:
+        body = f.read()
+    etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+
+    def view():
+        response = app.response_class(body, mimetype=mimetype)
+        response.set_etag(etag)
+        return response.make_conditional(request)
+    return view
+
+
+class CircuitBreaker:
+    """Fail fast after fail_max consecutive upstream failures, letting one
+    trial call through every reset_timeout seconds until one succeeds"""
+
+    def __init__(self, fail_max=3, reset_timeout=60):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """Whether the next upstream call should be attempted"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.fail_max:
+                self.opened_at = time.monotonic()
@@ -1,47 +1,41 @@
 #!/usr/bin/env python3
 """
 Manual model downloader for Mistral-7B-Instruct
-This will download the model to ./data/models/ directory
+This will download the checkpoint the model runner loads (MISTRAL_MODEL) into
+the Hugging Face cache, where the runner finds it on first start
 """
 
 import os
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch
+import importlib.util
+
+# The Rust hf_transfer backend parallelizes shard downloads when installed;
+# it has to be enabled before huggingface_hub is imported
+if importlib.util.find_spec('hf_transfer') is not None:
+    os.environ.setdefault('HF_HUB_ENABLE_HF_TRANSFER', '1')
+
+from huggingface_hub import snapshot_download
+from transformers import AutoTokenizer
+from modules.model_runner import MODEL_NAME
 
 def download_mistral_model():
     """Download Mistral-7B-Instruct model locally"""
     
-    model_name = "mistralai/Mistral-7B-Instruct-v0.2"
-    local_model_path = "./data/models/mistral-7b-instruct"
+    model_name = MODEL_NAME
     
     print("🚀 Starting Mistral-7B model download...")
     print(f"Model: {model_name}")
-    print(f"Local path: {local_model_path}")
-    print(f"Estimated size: ~13GB")
+    print("Estimated size: ~4GB for the default GPTQ checkpoint, ~14GB for fp16 weights")
     print("This will take 10-30 minutes depending on your internet speed...\n")
     
-    # Create directory
-    os.makedirs(local_model_path, exist_ok=True)
-    
     try:
-        # Download tokenizer
-        print("📥 Downloading tokenizer...")
-        tokenizer = AutoTokenizer.from_pretrained(
-            model_name,
-            trust_remote_code=True
+        # Fetch the repository files directly (safetensors weights, configs
+        # and tokenizer) without loading the model into torch
+        print("📥 Downloading model and tokenizer (this is the big one...)...")
+        local_model_path = snapshot_download(
+            repo_id=model_name,
+            allow_patterns=["*.json", "*.safetensors", "tokenizer*"],
+            max_workers=8
         )
-        tokenizer.save_pretrained(local_model_path)
-        print("✅ Tokenizer downloaded successfully!")
-        
-        # Download model
-        print("📥 Downloading model (this is the big one...)...")
-        model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            torch_dtype=torch.float16,
-            trust_remote_code=True,
-            low_cpu_mem_usage=True
-        )
-        model.save_pretrained(local_model_path)
         print("✅ Model downloaded successfully!")
         
         print(f"\n🎉 Download complete!")
@@ -60,12 +54,19 @@ def download_mistral_model():
 
 def get_folder_size(folder_path):
     """Get folder size in GB"""
+    return _folder_bytes(folder_path) / (1024**3)  # Convert to GB
+
+def _folder_bytes(folder_path):
+    """Total size in bytes of the files under folder_path, read from the
+    directory entries without joining paths"""
     total_size = 0
-    for dirpath, dirnames, filenames in os.walk(folder_path):
-        for filename in filenames:
-            filepath = os.path.join(dirpath, filename)
-            total_size += os.path.getsize(filepath)
-    return total_size / (1024**3)  # Convert to GB
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                total_size += _folder_bytes(entry.path)
+            elif entry.is_file():
+                total_size += entry.stat().st_size
+    return total_size
 
 if __name__ == "__main__":
     download_mistral_model()
\ No newline at end of file
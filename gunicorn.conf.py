@@ -0,0 +1,35 @@
+"""
+Gunicorn settings shared by the Flask services
+Usage: gunicorn -c gunicorn.conf.py
+       APP_MODULE=main:app gunicorn -c gunicorn.conf.py  (Cursor AI server)
+"""
+
+import os
+
+# The proxy by default; the Cursor AI server runs as main:app
+wsgi_app = os.getenv('APP_MODULE', 'app:app')
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# One process per core (capped, since each worker holds its own caches) so
+# JSON and regex work isn't serialized on a single GIL
+workers = int(os.getenv('WEB_CONCURRENCY', min(os.cpu_count() or 1, 4)))
+
+# Threaded workers so requests waiting on upstream AI calls don't block
+# each other
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+# Services that embed code can load the SentenceTransformer once in the
+# master with PRELOAD_EMBEDDER=1; forked workers then share its weight pages
+# copy-on-write instead of each loading their own copy. The preloaded model
+# is always placed on the CPU, since a CUDA context does not survive fork
+PRELOAD_EMBEDDER = os.getenv('PRELOAD_EMBEDDER', '').lower() in ('1', 'true', 'yes')
+
+
+def on_starting(server):
+    if PRELOAD_EMBEDDER:
+        from modules.embedder import get_embedder
+        get_embedder(device='cpu')
+        server.log.info("Embedding model preloaded in the master process")
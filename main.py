@@ -3,12 +3,25 @@ Real Cursor AI Headless Server
 Uses Anthropic Claude as the backend AI (since actual Cursor CLI can't run on Render)
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from config.app_config import configure_logging, init_json, init_request_limits, limit_body
 import os
+import re
+import shutil
 import logging
-import uuid
+import secrets
 import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Optional persistent second level for the generated-tests cache
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
 
 # Load environment variables
 try:
@@ -19,15 +32,153 @@ except ImportError:
 
 app = Flask(__name__)
 CORS(app)
+init_json(app)
+init_request_limits(app)
 
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Read once at import; the service has a single initialization path
+ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
+
+# At most this many Claude calls run at once per process so bursts queue
+# here instead of tripping rate limits; the SDK retries 429s with backoff
+ANTHROPIC_MAX_CONCURRENCY = int(os.getenv('ANTHROPIC_MAX_CONCURRENCY', 8))
+ANTHROPIC_MAX_RETRIES = int(os.getenv('ANTHROPIC_MAX_RETRIES', 3))
+
+# Small components are routed to the faster model; set FAST_MODEL_MAX_CHARS=0
+# to always use the main model
+CLAUDE_MODEL = os.getenv('CLAUDE_MODEL', 'claude-3-5-sonnet-20241022')
+CLAUDE_FAST_MODEL = os.getenv('CLAUDE_FAST_MODEL', 'claude-3-5-haiku-20241022')
+FAST_MODEL_MAX_CHARS = int(os.getenv('FAST_MODEL_MAX_CHARS', 1500))
+
+# Generated tests are also kept on disk when diskcache is installed, shared
+# by all workers and surviving restarts; set RESPONSE_CACHE_DIR='' to disable
+RESPONSE_CACHE_DIR = os.getenv('RESPONSE_CACHE_DIR', '/tmp/ragrail_llm_cache')
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 86400))
+
+# Sessions idle for longer than SESSION_TTL seconds are dropped, checked at
+# most once per sweep interval when new sessions are created
+SESSION_TTL = int(os.getenv('SESSION_TTL', 1800))
+SESSION_SWEEP_INTERVAL = 60
+# Oldest sessions are dropped beyond this many
+MAX_SESSIONS = int(os.getenv('MAX_SESSIONS', 1024))
+# Client-supplied session ids name workspace directories, so only plain
+# names are accepted
+SESSION_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+# Input budget for the component code; Claude has no local tokenizer, so
+# tokens are estimated at ~4 characters each
+MAX_COMPONENT_TOKENS = int(os.getenv('MAX_COMPONENT_TOKENS', 30000))
+CHARS_PER_TOKEN = 4
+
+# Most components accepted by one batch submission; cache keys for batches
+# that are never collected are forgotten after BATCH_KEY_TTL seconds
+MAX_BATCH_COMPONENTS = int(os.getenv('MAX_BATCH_COMPONENTS', 100))
+BATCH_KEY_TTL = int(os.getenv('BATCH_KEY_TTL', 2 * 86400))
+
+# Cursor AI style instructions for comprehensive test generation. They are
+# identical on every call and only the component varies per request; at a
+# few hundred tokens they are below Anthropic's minimum cacheable prefix, and
+# repeated components are already served from the response cache, so no
+# prompt-cache breakpoint is set
+TEST_GENERATION_SYSTEM = """You are Cursor AI, an expert code analysis and testing specialist. Generate comprehensive unit tests for React components with 90%+ coverage.
+
+CURSOR AI ANALYSIS REQUIREMENTS:
+1. Use Jest + React Testing Library + TypeScript
+2. Mock ALL external dependencies properly (@tanstack/react-query, @prism-ui/react, etc.)
+3. Test ALL state transitions and user interactions
+4. Cover edge cases and error scenarios thoroughly
+5. Include proper setup/teardown with beforeEach/afterEach
+6. Target 90%+ code coverage with comprehensive test scenarios
+7. Return COMPLETE, immediately runnable test file
+
+FOCUS AREAS (Cursor AI Analysis):
+- All React hooks (useState, useEffect, useIsMutating, etc.)
+- Props validation and all prop variations
+- Conditional rendering paths (loading vs loaded states)
+- Async operations and loading state management
+- Event handlers and user interactions
+- Error boundaries and edge cases
+- Data attributes and accessibility
+
+TESTING STRATEGY:
+- Test component in isolation with proper mocks
+- Test all code branches and conditional logic
+- Test state changes and their effects on rendering
+- Test props changes and their impact
+- Test error scenarios and edge cases
+
+Return ONLY the complete test file code that I can immediately copy and run."""
+
+# Per-request user turn; the component code is substituted with a single
+# %-format
+TEST_GENERATION_PROMPT = """Generate comprehensive unit tests for this React component.
+
+COMPONENT CODE:
+```typescript
+%s
+```"""
+
+# Cache keys start from a digest of the instructions so a prompt change
+# never serves tests generated for the old one
+_CACHE_KEY_BASE = hashlib.blake2b(TEST_GENERATION_SYSTEM.encode('utf-8'), digest_size=16)
+
+def trim_to_token_budget(code, max_tokens=MAX_COMPONENT_TOKENS):
+    """Trim code to roughly max_tokens, cutting at the last line boundary"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(code) <= max_chars:
+        return code
+    
+    cut = code.rfind('\n', 0, max_chars)
+    return code[:cut if cut > 0 else max_chars]
+
+def valid_session_id(session_id):
+    """Whether session_id is safe to use as a workspace directory name"""
+    return isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+def open_disk_cache():
+    """Open the persistent response cache, or return None when it is
+    disabled or unavailable"""
+    if diskcache is None or not RESPONSE_CACHE_DIR:
+        return None
+    try:
+        return diskcache.Cache(RESPONSE_CACHE_DIR, size_limit=2**30)
+    except Exception as e:
+        logger.warning("Disk response cache unavailable: %s", e)
+        return None
+
+# Workspace directories are removed off the request path
+_RMTREE_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix='rmtree')
+
 class CursorAIService:
     def __init__(self):
-        self.workspace_dir = "/tmp/cursor_workspaces"
+        # Session workspaces go to disk by default. Set
+        # CURSOR_WORKSPACE_DIR=/dev/shm/cursor_workspaces to keep component
+        # writes on tmpfs; Docker's /dev/shm is only 64 MB, so size it for
+        # MAX_SESSIONS live sessions (e.g. docker run --shm-size=1g) or writes
+        # fail with ENOSPC once it fills
+        self.workspace_dir = os.getenv('CURSOR_WORKSPACE_DIR', '/tmp/cursor_workspaces')
         self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.last_session_sweep = time.monotonic()
         self.anthropic_client = None
+        # Claude reads the component straight from the request, so session
+        # files are only written for a local Cursor CLI to pick up
+        self.cursor_cli_available = shutil.which('cursor') is not None
+        # LRU of generated tests keyed by a digest of the Claude request,
+        # backed by the disk cache
+        self.response_cache = OrderedDict()
+        self.response_cache_size = int(os.getenv('RESPONSE_CACHE_SIZE', 512))
+        self.cache_lock = threading.Lock()
+        self.disk_cache = open_disk_cache()
+        self.claude_slots = threading.BoundedSemaphore(ANTHROPIC_MAX_CONCURRENCY)
+        # Claude calls currently running, by cache key, so concurrent
+        # duplicates wait for the first one instead of repeating it
+        self.inflight = {}
+        # batch_id -> (submitted at, {custom_id: cache key}) for submitted
+        # Message Batches
+        self.batch_cache_keys = {}
         self.setup_environment()
     
     def setup_environment(self):
@@ -36,32 +187,46 @@ class CursorAIService:
             os.makedirs(self.workspace_dir, exist_ok=True)
             
             # Initialize Anthropic client
-            anthropic_key = os.getenv('ANTHROPIC_API_KEY')
-            if anthropic_key:
+            if ANTHROPIC_API_KEY:
                 import anthropic
-                self.anthropic_client = anthropic.Anthropic(api_key=anthropic_key)
+                self.anthropic_client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=ANTHROPIC_MAX_RETRIES)
                 logger.info("✅ Cursor AI backend ready (powered by Anthropic Claude)")
             else:
                 logger.error("❌ ANTHROPIC_API_KEY not found")
                 
         except Exception as e:
-            logger.error(f"Environment setup failed: {e}")
+            logger.error("Environment setup failed: %s", e)
     
     def create_session(self, session_id=None):
         """Create new session"""
         if not session_id:
-            session_id = str(uuid.uuid4())
+            session_id = secrets.token_hex(16)
+        elif not valid_session_id(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        
+        if time.monotonic() - self.last_session_sweep > SESSION_SWEEP_INTERVAL:
+            self.expire_sessions()
         
         session_workspace = os.path.join(self.workspace_dir, session_id)
+        if not self.in_workspace(session_workspace):
+            raise ValueError(f"Invalid session id: {session_id!r}")
         os.makedirs(session_workspace, exist_ok=True)
         
-        self.sessions[session_id] = {
-            'workspace': session_workspace,
-            'created': time.time(),
-            'files': []
-        }
+        now = time.time()
+        with self.sessions_lock:
+            self.sessions[session_id] = {
+                'workspace': session_workspace,
+                'created': now,
+                'last_used': now,
+                'files': [],
+                'file_hashes': {}
+            }
+            overflow = list(self.sessions)[:max(len(self.sessions) - MAX_SESSIONS, 0)]
         
-        logger.info(f"Created session: {session_id}")
+        for old_session in overflow:
+            self.remove_session(old_session)
+        
+        logger.info("Created session: %s", session_id)
         return session_id
     
     def add_file_to_session(self, session_id, filename, content):
@@ -69,15 +234,111 @@ class CursorAIService:
         if session_id not in self.sessions:
             session_id = self.create_session(session_id)
         
-        workspace = self.sessions[session_id]['workspace']
-        file_path = os.path.join(workspace, filename)
+        session = self.sessions[session_id]
+        session['last_used'] = time.time()
+        file_path = os.path.join(session['workspace'], filename)
+        
+        # Re-adding unchanged content leaves the file alone
+        digest = hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+        if session['file_hashes'].get(filename) == digest:
+            return file_path
         
-        with open(file_path, 'w', encoding='utf-8') as f:
+        # Write next to the target and swap it in so readers never see a
+        # partial file
+        tmp_path = f"{file_path}.{secrets.token_hex(4)}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             f.write(content)
+        os.replace(tmp_path, file_path)
         
-        self.sessions[session_id]['files'].append(filename)
+        if filename not in session['file_hashes']:
+            session['files'].append(filename)
+        session['file_hashes'][filename] = digest
         return file_path
     
+    def remove_session(self, session_id):
+        """Forget a session and remove its workspace off the request path;
+        returns False for unknown sessions"""
+        with self.sessions_lock:
+            session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        
+        if self.in_workspace(session['workspace']):
+            _RMTREE_POOL.submit(shutil.rmtree, session['workspace'], ignore_errors=True)
+        else:
+            logger.warning("Not removing %s, outside %s", session['workspace'], self.workspace_dir)
+        return True
+    
+    def in_workspace(self, path):
+        """Whether path resolves to a directory strictly inside the workspace
+        root"""
+        root = os.path.realpath(self.workspace_dir)
+        path = os.path.realpath(path)
+        return path != root and os.path.commonpath([root, path]) == root
+    
+    def expire_sessions(self):
+        """Remove sessions that have been idle for longer than SESSION_TTL"""
+        self.last_session_sweep = time.monotonic()
+        cutoff = time.time() - SESSION_TTL
+        with self.sessions_lock:
+            expired = [sid for sid, session in self.sessions.items() if session['last_used'] < cutoff]
+        
+        for session_id in expired:
+            self.remove_session(session_id)
+        if expired:
+            logger.info("🗑️ Expired %d idle sessions", len(expired))
+    
+    def _cache_key(self, claude_request):
+        """Short digest of everything that shapes a generation (model,
+        sampling settings and prompt) so large prompts aren't kept as keys"""
+        h = _CACHE_KEY_BASE.copy()
+        h.update(f"{claude_request['model']}\0{claude_request['max_tokens']}\0{claude_request['temperature']}\0".encode('utf-8'))
+        h.update(claude_request['messages'][0]['content'].encode('utf-8'))
+        return h.digest()
+    
+    def get_cached_response(self, key):
+        """Return cached generated tests for a key, or None"""
+        with self.cache_lock:
+            text = self.response_cache.get(key)
+            if text is not None:
+                self.response_cache.move_to_end(key)
+                return text
+        
+        if self.disk_cache is None:
+            return None
+        text = self.disk_cache.get(key)
+        if text is not None:
+            self._remember_response(key, text)
+        return text
+    
+    def _remember_response(self, key, text):
+        """Store generated tests in memory, evicting the least recently used
+        entries"""
+        with self.cache_lock:
+            self.response_cache[key] = text
+            self.response_cache.move_to_end(key)
+            while len(self.response_cache) > self.response_cache_size:
+                self.response_cache.popitem(last=False)
+    
+    def cache_response(self, key, text):
+        """Store generated tests in memory and on disk"""
+        self._remember_response(key, text)
+        if self.disk_cache is not None:
+            self.disk_cache.set(key, text, expire=RESPONSE_CACHE_TTL)
+    
+    def _claude_request(self, component_code):
+        """Keyword arguments for the Claude test-generation call"""
+        model = CLAUDE_FAST_MODEL if len(component_code) <= FAST_MODEL_MAX_CHARS else CLAUDE_MODEL
+        logger.info("Routing %d-char component to %s", len(component_code), model)
+        
+        return {
+            'model': model,
+            'max_tokens': 4000,
+            'temperature': 0.1,
+            'system': TEST_GENERATION_SYSTEM,
+            'messages': [{"role": "user", "content": TEST_GENERATION_PROMPT % (component_code,)}]
+        }
+    
     def generate_tests_with_cursor_ai(self, component_code, session_id):
         """Generate tests using Anthropic Claude (Cursor AI backend)"""
         try:
@@ -87,66 +348,158 @@ class CursorAIService:
                     'error': 'Cursor AI backend not available'
                 }
             
-            # Cursor AI style prompt for comprehensive test generation
-            prompt = f"""You are Cursor AI, an expert code analysis and testing specialist. Generate comprehensive unit tests for this React component with 90%+ coverage.
-
-COMPONENT CODE:
-```typescript
-{component_code}
-```
-
-CURSOR AI ANALYSIS REQUIREMENTS:
-1. Use Jest + React Testing Library + TypeScript
-2. Mock ALL external dependencies properly (@tanstack/react-query, @prism-ui/react, etc.)
-3. Test ALL state transitions and user interactions
-4. Cover edge cases and error scenarios thoroughly
-5. Include proper setup/teardown with beforeEach/afterEach
-6. Target 90%+ code coverage with comprehensive test scenarios
-7. Return COMPLETE, immediately runnable test file
-
-FOCUS AREAS (Cursor AI Analysis):
-- All React hooks (useState, useEffect, useIsMutating, etc.)
-- Props validation and all prop variations
-- Conditional rendering paths (loading vs loaded states)
-- Async operations and loading state management
-- Event handlers and user interactions
-- Error boundaries and edge cases
-- Data attributes and accessibility
-
-TESTING STRATEGY:
-- Test component in isolation with proper mocks
-- Test all code branches and conditional logic
-- Test state changes and their effects on rendering
-- Test props changes and their impact
-- Test error scenarios and edge cases
-
-Return ONLY the complete test file code that I can immediately copy and run."""
-
-            logger.info("🤖 Cursor AI generating comprehensive tests via Claude")
+            # Identical requests return the previously generated tests
+            claude_request = self._claude_request(component_code)
+            cache_key = self._cache_key(claude_request)
+            cached = self.get_cached_response(cache_key)
+            if cached is not None:
+                logger.info("⚡ Serving cached Cursor AI tests")
+                return {
+                    'success': True,
+                    'analysis': cached,
+                    'service': 'cursor-ai-claude',
+                    'session_id': session_id,
+                    'cached': True
+                }
             
-            # Call Claude with Cursor AI persona
-            response = self.anthropic_client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=4000,
-                temperature=0.1,
-                messages=[{"role": "user", "content": prompt}]
-            )
+            analysis = self._generate_once(cache_key, claude_request)
             
             return {
                 'success': True,
-                'analysis': response.content[0].text,
+                'analysis': analysis,
                 'service': 'cursor-ai-claude',
                 'session_id': session_id
             }
             
         except Exception as e:
-            logger.error(f"Cursor AI generation error: {e}")
+            logger.error("Cursor AI generation error: %s", e)
             return {
                 'success': False,
                 'error': f'Cursor AI error: {str(e)}',
                 'session_id': session_id
             }
 
+    def _generate_once(self, cache_key, claude_request):
+        """Call Claude for a cache key, or wait for the identical call that
+        is already running and share its result"""
+        with self.cache_lock:
+            call = self.inflight.get(cache_key)
+            leader = call is None
+            if leader:
+                call = self.inflight[cache_key] = {'done': threading.Event(), 'text': None, 'error': None}
+        
+        if not leader:
+            logger.info("⏳ Waiting for identical in-flight Cursor AI request")
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['text']
+        
+        try:
+            logger.info("🤖 Cursor AI generating comprehensive tests via Claude")
+            
+            # Call Claude with Cursor AI persona
+            with self.claude_slots:
+                response = self.anthropic_client.messages.create(**claude_request)
+            
+            usage = response.usage
+            logger.info(
+                "Claude usage: %d input tokens, %d output tokens",
+                usage.input_tokens, usage.output_tokens
+            )
+            
+            call['text'] = response.content[0].text
+            self.cache_response(cache_key, call['text'])
+            return call['text']
+        
+        except Exception as e:
+            call['error'] = e
+            raise
+        
+        finally:
+            with self.cache_lock:
+                del self.inflight[cache_key]
+            call['done'].set()
+
+    def stream_tests_with_cursor_ai(self, component_code):
+        """Yield generated tests as text deltas while Claude produces them"""
+        claude_request = self._claude_request(component_code)
+        cache_key = self._cache_key(claude_request)
+        cached = self.get_cached_response(cache_key)
+        if cached is not None:
+            logger.info("⚡ Serving cached Cursor AI tests")
+            yield cached
+            return
+        
+        logger.info("🤖 Cursor AI streaming comprehensive tests via Claude")
+        
+        parts = []
+        with self.claude_slots, self.anthropic_client.messages.stream(**claude_request) as stream:
+            for text in stream.text_stream:
+                parts.append(text)
+                yield text
+        
+        self.cache_response(cache_key, ''.join(parts))
+
+    def submit_test_batch(self, components):
+        """Queue components on the Message Batches API, which generates them
+        asynchronously at half the per-token price; results are keyed
+        c0, c1, ... in input order"""
+        batch_requests = []
+        cache_keys = {}
+        for i, component_code in enumerate(components):
+            custom_id = f"c{i}"
+            claude_request = self._claude_request(component_code)
+            cache_keys[custom_id] = self._cache_key(claude_request)
+            batch_requests.append({'custom_id': custom_id, 'params': claude_request})
+        
+        batch = self.anthropic_client.messages.batches.create(requests=batch_requests)
+        now = time.monotonic()
+        with self.cache_lock:
+            expired = [bid for bid, (submitted, _) in self.batch_cache_keys.items() if now - submitted > BATCH_KEY_TTL]
+            for bid in expired:
+                del self.batch_cache_keys[bid]
+            self.batch_cache_keys[batch.id] = (now, cache_keys)
+        logger.info("📦 Submitted %d components as batch %s", len(batch_requests), batch.id)
+        return batch
+    
+    def collect_test_batch(self, batch_id):
+        """Return the batch's processing status and, once it has ended, the
+        generated tests by custom_id"""
+        batch = self.anthropic_client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != 'ended':
+            return batch.processing_status, None
+        
+        with self.cache_lock:
+            _, cache_keys = self.batch_cache_keys.pop(batch_id, (None, {}))
+        results = {}
+        for entry in self.anthropic_client.messages.batches.results(batch_id):
+            if entry.result.type == 'succeeded':
+                analysis = entry.result.message.content[0].text
+                results[entry.custom_id] = {'success': True, 'analysis': analysis}
+                if entry.custom_id in cache_keys:
+                    self.cache_response(cache_keys[entry.custom_id], analysis)
+            else:
+                results[entry.custom_id] = {'success': False, 'error': f'Batch request {entry.result.type}'}
+        
+        return batch.processing_status, results
+
+def sse_test_events(component_code, session_id):
+    """Server-Sent Events for a streamed test generation"""
+    try:
+        if not cursor_ai_service.anthropic_client:
+            yield f"data: {app.json.dumps({'error': 'Cursor AI backend not available'})}\n\n"
+            return
+        
+        for text in cursor_ai_service.stream_tests_with_cursor_ai(component_code):
+            yield f"data: {app.json.dumps({'delta': text})}\n\n"
+        
+        yield f"data: {app.json.dumps({'done': True, 'service': 'cursor-ai-claude', 'session_id': session_id})}\n\n"
+        
+    except Exception as e:
+        logger.error("Cursor AI streaming error: %s", e)
+        yield f"data: {app.json.dumps({'error': f'Cursor AI error: {str(e)}', 'session_id': session_id})}\n\n"
+
 # Global service instance
 cursor_ai_service = CursorAIService()
 
@@ -158,10 +511,12 @@ def health_check():
         'service': 'cursor-ai-proxy',
         'anthropic_available': cursor_ai_service.anthropic_client is not None,
         'active_sessions': len(cursor_ai_service.sessions),
+        'cursor_cli_available': cursor_ai_service.cursor_cli_available,
         'backend': 'anthropic-claude'
     })
 
 @app.route('/api/cursor/analyze', methods=['POST'])
+@limit_body()
 def cursor_analyze():
     """Main Cursor AI endpoint"""
     try:
@@ -169,19 +524,35 @@ def cursor_analyze():
         
         component_code = data.get('component_code', '')
         task_type = data.get('task_type', 'test_generation')
-        session_id = data.get('session_id', str(uuid.uuid4()))
+        session_id = data.get('session_id') or secrets.token_hex(16)
         
         if not component_code:
             return jsonify({'error': 'Component code is required'}), 400
+        if not valid_session_id(session_id):
+            return jsonify({'error': 'session_id must be 1-64 letters, digits, "_" or "-"'}), 400
         
-        logger.info(f"🎯 Cursor AI request - Task: {task_type}")
+        trimmed = trim_to_token_budget(component_code)
+        if len(trimmed) < len(component_code):
+            logger.warning("Trimmed component from %d to %d chars", len(component_code), len(trimmed))
+            component_code = trimmed
         
-        # Create session if needed
-        if session_id not in cursor_ai_service.sessions:
-            cursor_ai_service.create_session(session_id)
+        logger.info("🎯 Cursor AI request - Task: %s", task_type)
+        
+        if cursor_ai_service.cursor_cli_available:
+            # Create session if needed
+            if session_id not in cursor_ai_service.sessions:
+                cursor_ai_service.create_session(session_id)
+            
+            # Add component to session
+            cursor_ai_service.add_file_to_session(session_id, 'Component.tsx', component_code)
         
-        # Add component to session
-        cursor_ai_service.add_file_to_session(session_id, 'Component.tsx', component_code)
+        # Stream tokens back as they are generated when the client asks for it
+        if data.get('stream'):
+            return Response(
+                stream_with_context(sse_test_events(component_code, session_id)),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache'}
+            )
         
         # Generate tests with Cursor AI
         result = cursor_ai_service.generate_tests_with_cursor_ai(component_code, session_id)
@@ -189,22 +560,77 @@ def cursor_analyze():
         return jsonify(result)
         
     except Exception as e:
-        logger.error(f"Analysis error: {str(e)}")
+        logger.error("Analysis error: %s", e)
         return jsonify({
             'success': False,
             'error': f'Analysis failed: {str(e)}'
         }), 500
 
+@app.route('/api/cursor/analyze_batch', methods=['POST'])
+@limit_body()
+def cursor_analyze_batch():
+    """Queue several components for discounted asynchronous generation"""
+    try:
+        data = request.get_json()
+        components = data.get('components')
+        
+        if not isinstance(components, list) or not components or not all(isinstance(code, str) and code for code in components):
+            return jsonify({'error': 'components must be a non-empty list of component code'}), 400
+        if len(components) > MAX_BATCH_COMPONENTS:
+            return jsonify({'error': f'At most {MAX_BATCH_COMPONENTS} components per batch'}), 400
+        
+        if not cursor_ai_service.anthropic_client:
+            return jsonify({'success': False, 'error': 'Cursor AI backend not available'}), 503
+        
+        batch = cursor_ai_service.submit_test_batch([trim_to_token_budget(code) for code in components])
+        
+        return jsonify({
+            'success': True,
+            'batch_id': batch.id,
+            'status': batch.processing_status,
+            'custom_ids': [f"c{i}" for i in range(len(components))]
+        }), 202
+        
+    except Exception as e:
+        logger.error("Batch submission error: %s", e)
+        return jsonify({
+            'success': False,
+            'error': f'Batch submission failed: {str(e)}'
+        }), 500
+
+@app.route('/api/cursor/analyze_batch/<batch_id>', methods=['GET'])
+def cursor_batch_results(batch_id):
+    """Poll a queued batch; results are included once it has ended"""
+    try:
+        if not cursor_ai_service.anthropic_client:
+            return jsonify({'success': False, 'error': 'Cursor AI backend not available'}), 503
+        
+        status, results = cursor_ai_service.collect_test_batch(batch_id)
+        
+        return jsonify({
+            'success': True,
+            'batch_id': batch_id,
+            'status': status,
+            'results': results,
+            'service': 'cursor-ai-claude'
+        })
+        
+    except Exception as e:
+        logger.error("Batch retrieval error: %s", e)
+        return jsonify({
+            'success': False,
+            'error': f'Batch retrieval failed: {str(e)}'
+        }), 500
+
 @app.route('/api/cursor/session/<session_id>', methods=['DELETE'])
 def cleanup_session(session_id):
     """Cleanup session"""
+    if not valid_session_id(session_id):
+        return jsonify({'success': False, 'error': 'Invalid session id'}), 400
+    
     try:
-        if session_id in cursor_ai_service.sessions:
-            import shutil
-            workspace = cursor_ai_service.sessions[session_id]['workspace']
-            shutil.rmtree(workspace, ignore_errors=True)
-            del cursor_ai_service.sessions[session_id]
-            logger.info(f"🗑️ Cleaned up session: {session_id}")
+        if cursor_ai_service.remove_session(session_id):
+            logger.info("🗑️ Cleaned up session: %s", session_id)
         
         return jsonify({'success': True, 'message': 'Session cleaned up'})
         
@@ -217,5 +643,6 @@ if __name__ == '__main__':
     print("🎯 Backend: Anthropic Claude (Cursor AI compatible)")
     print("🔄 Provides Cursor AI functionality via Claude")
     
+    # Development server only; serve with APP_MODULE=main:app gunicorn -c gunicorn.conf.py
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port, debug=False)
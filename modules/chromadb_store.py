@@ -1,12 +1,178 @@
 import chromadb
 from chromadb.config import Settings
+import numpy as np
 import os
 import uuid
+import sqlite3
+import threading
+from contextlib import closing
+from collections import OrderedDict
 from typing import List, Dict, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Recently embedded search queries, most recently used last
+QUERY_CACHE_SIZE = 512
+_query_embeddings = OrderedDict()
+_query_embeddings_lock = threading.Lock()
+
+def _encode_queries(queries: List[str]) -> List[List[float]]:
+    """Embed search queries, encoding every uncached one in a single batch;
+    repeated queries skip the transformer pass"""
+    with _query_embeddings_lock:
+        cached = {query: _query_embeddings.get(query) for query in queries}
+        for query, embedding in cached.items():
+            if embedding is not None:
+                _query_embeddings.move_to_end(query)
+    
+    missing = [query for query, embedding in cached.items() if embedding is None]
+    if missing:
+        from .embedder import get_embedder
+        embeddings = get_embedder().model.encode(
+            missing, batch_size=len(missing), normalize_embeddings=True
+        ).tolist()
+        with _query_embeddings_lock:
+            for query, embedding in zip(missing, embeddings):
+                cached[query] = embedding
+                _query_embeddings[query] = embedding
+            while len(_query_embeddings) > QUERY_CACHE_SIZE:
+                _query_embeddings.popitem(last=False)
+    
+    return [cached[query] for query in queries]
+
+class SessionIndex:
+    """Session -> chunk id index kept in SQLite next to the Chroma data, so
+    every worker process reads and updates the same copy"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL UNIQUE
+                );
+                CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_id TEXT PRIMARY KEY,
+                    session_id TEXT NOT NULL,
+                    type TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS chunks_by_session ON chunks (session_id);
+                CREATE TABLE IF NOT EXISTS state (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per call keeps threads independent; SQLite's own
+        # locking serializes writers across processes
+        return sqlite3.connect(self.path, timeout=30)
+
+    def build(self, collection):
+        """Fill the index from the collection's metadata with one pass, once
+        per store; later calls return without scanning"""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT 1 FROM state WHERE key = 'built'").fetchone():
+                    conn.rollback()
+                    return
+                
+                results = collection.get(include=['metadatas'])
+                rows = [
+                    (metadata['session_id'], chunk_id, metadata.get('type', 'unknown'))
+                    for chunk_id, metadata in zip(results['ids'], results['metadatas'] or [])
+                    if metadata.get('session_id')
+                ]
+                self._insert(conn, rows)
+                conn.execute("INSERT INTO state (key, value) VALUES ('built', 1)")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, rows: List[tuple]):
+        conn.executemany(
+            "INSERT OR IGNORE INTO sessions (session_id) VALUES (?)",
+            [(session_id,) for session_id in dict.fromkeys(row[0] for row in rows)]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO chunks (session_id, chunk_id, type) VALUES (?, ?, ?)",
+            rows
+        )
+
+    @staticmethod
+    def _bump_generation(conn: sqlite3.Connection):
+        conn.execute(
+            "INSERT INTO state (key, value) VALUES ('generation', 1) "
+            "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+        )
+
+    def add(self, session_id: str, chunk_types: Dict[str, str], bump: bool = True, stale: List[str] = ()):
+        """Record stored chunks (chunk id -> type) for a session, forgetting
+        the stale chunk ids; bump=False records chunks that were already
+        stored without marking a change"""
+        with closing(self._connect()) as conn, conn:
+            if stale:
+                conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in stale])
+            self._insert(conn, [(session_id, chunk_id, chunk_type) for chunk_id, chunk_type in chunk_types.items()])
+            if bump:
+                self._bump_generation(conn)
+
+    def file_types(self, session_id: str) -> Optional[Dict[str, int]]:
+        """Chunk counts by type for a session, or None if it isn't indexed"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT type, COUNT(*) FROM chunks WHERE session_id = ? GROUP BY type",
+                (session_id,)
+            ).fetchall()
+        return dict(rows) if rows else None
+
+    def chunk_ids(self, session_id: str) -> List[str]:
+        """Ids of the chunks indexed for a session"""
+        with closing(self._connect()) as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT chunk_id FROM chunks WHERE session_id = ?", (session_id,)
+            )]
+
+    def old_sessions(self, keep_recent: int) -> List[tuple]:
+        """(session_id, chunk ids) for every session but the keep_recent
+        most recently first stored, oldest first"""
+        with closing(self._connect()) as conn:
+            sessions = [row[0] for row in conn.execute(
+                "SELECT session_id FROM sessions ORDER BY seq DESC LIMIT -1 OFFSET ?",
+                (keep_recent,)
+            )]
+            return [
+                (session_id, [row[0] for row in conn.execute(
+                    "SELECT chunk_id FROM chunks WHERE session_id = ?", (session_id,)
+                )])
+                for session_id in reversed(sessions)
+            ]
+
+    def remove(self, session_id: str):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM chunks WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._bump_generation(conn)
+
+    def clear(self):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM chunks")
+            conn.execute("DELETE FROM sessions")
+            self._bump_generation(conn)
+
+    @property
+    def generation(self) -> int:
+        """Counter bumped by every change from any process"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM state WHERE key = 'generation'").fetchone()
+        return row[0] if row else 0
+
 class CodeVectorStore:
     def __init__(self, persist_directory: str = "data/vector_store"):
         """Initialize ChromaDB with persistence"""
@@ -25,29 +191,48 @@ class CodeVectorStore:
             
             self.collection_name = "react_code_chunks"
             self.collection = self._get_or_create_collection()
+            # Chunk ids and types by session, shared by every worker process
+            self.session_index = SessionIndex(os.path.join(persist_directory, "session_index.sqlite3"))
+            try:
+                self.session_index.build(self.collection)
+            except Exception as e:
+                logger.warning("Failed to build session index: %s", e)
             
-            logger.info(f"ChromaDB initialized with persistence at {persist_directory}")
+            logger.info("ChromaDB initialized with persistence at %s", persist_directory)
             
         except Exception as e:
-            logger.error(f"Failed to initialize ChromaDB: {e}")
+            logger.error("Failed to initialize ChromaDB: %s", e)
             raise
 
     def _get_or_create_collection(self):
         """Get existing collection or create new one"""
+        # Metadata is only passed on creation: updating it on an existing
+        # collection would claim a distance space its index was not built with
         try:
-            # Try to get existing collection
-            collection = self.client.get_collection(self.collection_name)
-            logger.info(f"Using existing collection: {self.collection_name}")
-        except:
-            # Create new collection
-            collection = self.client.create_collection(
+            collection = self.client.get_collection(name=self.collection_name)
+        except ValueError:
+            # Embeddings are unit length, so inner product ranks like cosine
+            # without per-comparison norms
+            collection = self.client.get_or_create_collection(
                 name=self.collection_name,
-                metadata={"description": "React code chunks with embeddings"}
+                metadata={"description": "React code chunks with embeddings", "hnsw:space": "ip"}
             )
-            logger.info(f"Created new collection: {self.collection_name}")
         
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        if space != "ip":
+            logger.warning(
+                "Collection %s uses '%s' distance; reset the database to switch to inner product",
+                self.collection_name, space
+            )
+        logger.info("Using collection: %s", self.collection_name)
         return collection
 
+    @property
+    def generation(self) -> int:
+        """Changes whenever any process stores, cleans up or resets chunks,
+        so callers can tell when cached search results are stale"""
+        return self.session_index.generation
+
     def store_chunks(self, chunks: List[Dict], session_id: Optional[str] = None) -> str:
         """
         Store code chunks in the vector database
@@ -63,7 +248,6 @@ class CodeVectorStore:
         try:
             # Prepare data for ChromaDB
             documents = []
-            embeddings = []
             metadatas = []
             ids = []
             
@@ -85,81 +269,122 @@ class CodeVectorStore:
                 }
                 
                 documents.append(doc_text)
-                embeddings.append(chunk['embedding'])
                 metadatas.append(metadata)
                 ids.append(chunk_id)
             
-            # Store in ChromaDB
-            self.collection.add(
+            # Chroma takes nested lists; convert the whole matrix in one call
+            # rather than per chunk
+            embeddings = np.asarray([chunk['embedding'] for chunk in chunks], dtype=np.float32)
+            
+            # Store in ChromaDB; re-storing a session overwrites its chunks,
+            # and chunks past the end of a shorter upload are deleted
+            new_ids = set(ids)
+            stale = [chunk_id for chunk_id in self.session_index.chunk_ids(session_id) if chunk_id not in new_ids]
+            self.collection.upsert(
                 documents=documents,
-                embeddings=embeddings,
+                embeddings=embeddings.tolist(),
                 metadatas=metadatas,
                 ids=ids
             )
+            if stale:
+                self.collection.delete(ids=stale)
+            
+            self.session_index.add(session_id, {
+                chunk_id: metadata['type'] for chunk_id, metadata in zip(ids, metadatas)
+            }, stale=stale)
             
-            logger.info(f"Stored {len(chunks)} chunks with session_id: {session_id}")
+            logger.info("Stored %d chunks with session_id: %s", len(chunks), session_id)
             return session_id
             
         except Exception as e:
-            logger.error(f"Failed to store chunks: {e}")
+            logger.error("Failed to store chunks: %s", e)
             raise
 
     def search_similar_chunks(self, query: str, session_id: str, top_k: int = 5) -> List[Dict]:
         """
         Search for similar code chunks using semantic similarity
         """
+        return self.search_similar_chunks_batch([query], session_id, top_k)[0]
+
+    def search_similar_chunks_batch(self, queries: List[str], session_id: str, top_k: int = 5) -> List[List[Dict]]:
+        """
+        Search for chunks similar to each query with one embedding batch and
+        one ChromaDB query, returning one result list per query
+        """
         try:
-            # Import embedder to encode query
-            from .embedder import get_embedder
-            embedder = get_embedder()
-            
-            # Encode the query
-            query_embedding = embedder.model.encode([query])[0].tolist()
+            # Encode the queries
+            query_embeddings = _encode_queries(queries)
             
             # Search in ChromaDB
             results = self.collection.query(
-                query_embeddings=[query_embedding],
+                query_embeddings=query_embeddings,
                 n_results=top_k,
                 where={"session_id": session_id}  # Filter by session
             )
             
             # Format results
-            chunks = []
-            if results['documents'] and results['documents'][0]:
-                for i in range(len(results['documents'][0])):
+            all_chunks = []
+            for q, query in enumerate(queries):
+                chunks = []
+                documents = results['documents'][q] if results['documents'] else []
+                for i in range(len(documents)):
+                    metadata = results['metadatas'][q][i]
                     chunk = {
-                        'text': results['documents'][0][i],
-                        'metadata': results['metadatas'][0][i],
-                        'distance': results['distances'][0][i] if results['distances'] else 0,
-                        'filename': results['metadatas'][0][i]['filename'],
-                        'type': results['metadatas'][0][i]['type'],
-                        'start_line': results['metadatas'][0][i]['start_line'],
-                        'end_line': results['metadatas'][0][i]['end_line']
+                        'text': documents[i],
+                        'metadata': metadata,
+                        'distance': results['distances'][q][i] if results['distances'] else 0,
+                        'filename': metadata['filename'],
+                        'type': metadata['type'],
+                        'start_line': metadata['start_line'],
+                        'end_line': metadata['end_line']
                     }
                     chunks.append(chunk)
-            
-            logger.info(f"Found {len(chunks)} similar chunks for query: {query[:50]}...")
-            return chunks
+                
+                logger.info("Found %d similar chunks for query: %.50s...", len(chunks), query)
+                all_chunks.append(chunks)
+            return all_chunks
             
         except Exception as e:
-            logger.error(f"Search failed: {e}")
-            return []
+            logger.error("Search failed: %s", e)
+            return [[] for _ in queries]
 
     def get_session_stats(self, session_id: str) -> Dict:
         """Get statistics for a session"""
+        try:
+            file_types = self.session_index.file_types(session_id)
+            if file_types is not None:
+                return {
+                    'session_id': session_id,
+                    'total_chunks': sum(file_types.values()),
+                    'file_types': file_types
+                }
+        except Exception as e:
+            logger.warning("Session index lookup failed: %s", e)
+        
+        # Sessions the index doesn't know about are read from the chunks'
+        # metadata and recorded, so later lookups skip the scan
         try:
             results = self.collection.get(
-                where={"session_id": session_id}
+                where={"session_id": session_id},
+                include=['metadatas']
             )
             
             total_chunks = len(results['ids']) if results['ids'] else 0
             
             # Count by file type
             file_types = {}
+            chunk_types = {}
             if results['metadatas']:
-                for metadata in results['metadatas']:
+                for chunk_id, metadata in zip(results['ids'], results['metadatas']):
                     file_type = metadata.get('type', 'unknown')
                     file_types[file_type] = file_types.get(file_type, 0) + 1
+                    chunk_types[chunk_id] = file_type
+            
+            if chunk_types:
+                try:
+                    self.session_index.add(session_id, chunk_types, bump=False)
+                except Exception as e:
+                    logger.warning("Failed to index session %s: %s", session_id, e)
             
             return {
                 'session_id': session_id,
@@ -168,56 +393,43 @@ class CodeVectorStore:
             }
             
         except Exception as e:
-            logger.error(f"Failed to get session stats: {e}")
+            logger.error("Failed to get session stats: %s", e)
             return {'session_id': session_id, 'total_chunks': 0, 'file_types': {}}
 
     def cleanup_old_sessions(self, keep_recent: int = 10):
         """Clean up old sessions to save space"""
         try:
-            # Get all sessions
-            all_results = self.collection.get()
-            if not all_results['metadatas']:
-                return
-            
-            # Group by session_id
-            sessions = {}
-            for metadata in all_results['metadatas']:
-                session_id = metadata.get('session_id')
-                if session_id:
-                    if session_id not in sessions:
-                        sessions[session_id] = []
-                    sessions[session_id].append(metadata)
-            
-            # Keep only recent sessions
-            session_ids = list(sessions.keys())
-            if len(session_ids) > keep_recent:
-                old_sessions = session_ids[:-keep_recent]
-                
-                for old_session in old_sessions:
-                    # Delete chunks from old session
-                    self.collection.delete(
-                        where={"session_id": old_session}
-                    )
-                    logger.info(f"Cleaned up old session: {old_session}")
+            # Keep only recent sessions, deleting the rest by id instead of
+            # scanning every chunk's metadata
+            for old_session, chunk_ids in self.session_index.old_sessions(keep_recent):
+                if chunk_ids:
+                    self.collection.delete(ids=chunk_ids)
+                self.session_index.remove(old_session)
+                logger.info("Cleaned up old session: %s", old_session)
                     
         except Exception as e:
-            logger.warning(f"Cleanup failed: {e}")
+            logger.warning("Cleanup failed: %s", e)
 
     def reset_database(self):
         """Reset the entire database (use with caution!)"""
         try:
             self.client.delete_collection(self.collection_name)
             self.collection = self._get_or_create_collection()
+            self.session_index.clear()
             logger.info("Database reset successfully")
         except Exception as e:
-            logger.error(f"Failed to reset database: {e}")
+            logger.error("Failed to reset database: %s", e)
 
-# Global instance
+# Global instance, created under a lock so concurrent first calls build
+# only one
 _vector_store = None
+_vector_store_lock = threading.Lock()
 
 def get_vector_store():
     """Get or create the global vector store instance"""
     global _vector_store
     if _vector_store is None:
-        _vector_store = CodeVectorStore()
+        with _vector_store_lock:
+            if _vector_store is None:
+                _vector_store = CodeVectorStore()
     return _vector_store
\ No newline at end of file
@@ -1,115 +1,135 @@
+import os
 import re
-import base64
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from typing import List, Dict, Tuple
-from sentence_transformers import SentenceTransformer
+import numpy as np
 import logging
 
+# pybase64 is a SIMD-accelerated drop-in for the stdlib module
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
 logger = logging.getLogger(__name__)
 
+# Every keyword _detect_chunk_type looks for, found case-insensitively in one
+# scan; the lookahead lets overlapping keywords all be reported
+_CHUNK_KEYWORDS = re.compile(
+    r'(?=(useeffect|usestate|function|component|class|extends|interface|type|export|import))',
+    re.IGNORECASE
+)
+
+# Chunks are short (<= 500 chars), so large batches keep the GPU busy
+EMBED_BATCH_SIZE = 128
+
+# 'torch' runs sentence-transformers; 'onnx' runs an ONNX export of the same
+# model on onnxruntime, which is much faster on CPU-only hosts (install
+# requirements-onnx.txt for it)
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+# The ONNX export is written here on first use and loaded from it afterwards
+ONNX_CACHE_DIR = os.getenv('ONNX_CACHE_DIR', '/tmp/ragrail_onnx')
+
+# Uploads with at least this many files are chunked in worker processes
+PARALLEL_CHUNK_MIN_FILES = int(os.getenv('PARALLEL_CHUNK_MIN_FILES', 32))
+_chunk_pool = None
+_chunk_pool_lock = threading.Lock()
+
+class OnnxEncoder:
+    """ONNX Runtime encoder for a sentence-transformers model, providing the
+    subset of SentenceTransformer.encode used here"""
+
+    def __init__(self, model_name: str, max_length: int = 256):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+        
+        model_id = model_name if '/' in model_name else f"sentence-transformers/{model_name}"
+        export_dir = os.path.join(ONNX_CACHE_DIR, model_id.replace('/', '--'))
+        if not os.path.isdir(export_dir):
+            self._export(ORTModelForFeatureExtraction, AutoTokenizer, model_id, export_dir)
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            export_dir,
+            provider="CPUExecutionProvider"
+        )
+        self.max_length = max_length
+        self.device = 'cpu (onnxruntime)'
+
+    @staticmethod
+    def _export(model_cls, tokenizer_cls, model_id: str, export_dir: str):
+        """Export model_id to ONNX in export_dir; written to a temporary
+        directory and renamed so concurrent workers never load a partial
+        export"""
+        logger.info("Exporting %s to ONNX in %s", model_id, export_dir)
+        os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=ONNX_CACHE_DIR)
+        try:
+            model_cls.from_pretrained(model_id, export=True).save_pretrained(tmp_dir)
+            tokenizer_cls.from_pretrained(model_id).save_pretrained(tmp_dir)
+            os.rename(tmp_dir, export_dir)
+        except OSError:
+            # Another worker finished the same export first
+            if not os.path.isdir(export_dir):
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        """Mean-pooled embeddings for texts as one float32 matrix"""
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + batch_size],
+                padding='longest',
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors='np'
+            )
+            hidden = self.model(**tokens).last_hidden_state
+            
+            # Average the token vectors, ignoring padding
+            mask = tokens['attention_mask'][..., None].astype(np.float32)
+            batches.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        
+        embeddings = np.concatenate(batches).astype(np.float32, copy=False)
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
 class CodeEmbedder:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        """Initialize the code embedder with a lightweight model"""
+    def __init__(self, model_name="all-MiniLM-L6-v2", backend=EMBEDDING_BACKEND, device=None):
+        """Initialize the code embedder with a lightweight model; device
+        defaults to CUDA when available"""
         try:
-            self.model = SentenceTransformer(model_name)
-            logger.info(f"Loaded embedding model: {model_name}")
+            if backend == 'onnx':
+                self.model = OnnxEncoder(model_name)
+            else:
+                # Imported here so chunking worker processes don't load torch
+                from sentence_transformers import SentenceTransformer
+                self.model = SentenceTransformer(model_name, device=device)
+                # Half precision halves activation memory and uses tensor cores
+                if self.model.device.type == 'cuda':
+                    self.model.half()
+            logger.info("Loaded embedding model: %s on %s", model_name, self.model.device)
         except Exception as e:
-            logger.error(f"Failed to load embedding model: {e}")
+            logger.error("Failed to load embedding model: %s", e)
             raise
 
     def smart_chunk_code(self, code: str, filename: str, max_chunk_size: int = 500) -> List[Dict]:
         """
         Intelligently chunk code by functions, classes, and logical blocks
         """
-        chunks = []
-        
-        # Language detection based on file extension
-        if filename.endswith(('.tsx', '.jsx')):
-            lang = 'jsx'
-        elif filename.endswith('.ts'):
-            lang = 'typescript'
-        else:
-            lang = 'javascript'
-        
-        # Split by functions, classes, and React components
-        patterns = [
-            r'(function\s+\w+\s*\([^)]*\)\s*\{[^}]*\})',  # Functions
-            r'(const\s+\w+\s*=\s*\([^)]*\)\s*=>\s*\{[^}]*\})',  # Arrow functions
-            r'(class\s+\w+[^{]*\{[^}]*\})',  # Classes
-            r'(export\s+(default\s+)?function\s+\w+[^{]*\{[^}]*\})',  # Exported functions
-            r'(export\s+const\s+\w+\s*=[^;]*;)',  # Exported constants
-            r'(interface\s+\w+\s*\{[^}]*\})',  # TypeScript interfaces
-            r'(type\s+\w+\s*=[^;]*;)',  # TypeScript types
-        ]
-        
-        lines = code.split('\n')
-        current_chunk = []
-        current_size = 0
-        
-        for i, line in enumerate(lines):
-            line_size = len(line)
-            
-            # Check if this line starts a new logical block
-            is_new_block = any(re.match(pattern, line.strip()) for pattern in [
-                r'function\s+\w+',
-                r'const\s+\w+\s*=\s*\(',
-                r'class\s+\w+',
-                r'export\s+',
-                r'interface\s+\w+',
-                r'type\s+\w+',
-            ])
-            
-            # If adding this line would exceed chunk size and we have content, create a chunk
-            if current_size + line_size > max_chunk_size and current_chunk:
-                chunk_text = '\n'.join(current_chunk)
-                if chunk_text.strip():
-                    chunks.append({
-                        'text': chunk_text,
-                        'filename': filename,
-                        'start_line': i - len(current_chunk) + 1,
-                        'end_line': i,
-                        'language': lang,
-                        'type': self._detect_chunk_type(chunk_text)
-                    })
-                current_chunk = []
-                current_size = 0
-            
-            current_chunk.append(line)
-            current_size += line_size
-        
-        # Add the last chunk
-        if current_chunk:
-            chunk_text = '\n'.join(current_chunk)
-            if chunk_text.strip():
-                chunks.append({
-                    'text': chunk_text,
-                    'filename': filename,
-                    'start_line': len(lines) - len(current_chunk) + 1,
-                    'end_line': len(lines),
-                    'language': lang,
-                    'type': self._detect_chunk_type(chunk_text)
-                })
-        
-        logger.info(f"Created {len(chunks)} chunks from {filename}")
-        return chunks
+        return chunk_code(code, filename, max_chunk_size)
 
     def _detect_chunk_type(self, code: str) -> str:
         """Detect the type of code chunk"""
-        code_lower = code.lower()
-        
-        if 'useeffect' in code_lower or 'usestate' in code_lower:
-            return 'react_hook'
-        elif 'function' in code_lower and 'component' in code_lower:
-            return 'react_component'
-        elif 'class' in code_lower and 'extends' in code_lower:
-            return 'class_component'
-        elif 'interface' in code_lower or 'type' in code_lower:
-            return 'typescript_definition'
-        elif 'export' in code_lower:
-            return 'module_export'
-        elif 'import' in code_lower:
-            return 'import_statement'
-        else:
-            return 'code_block'
+        return detect_chunk_type(code)
 
     def embed_chunks(self, chunks: List[Dict]) -> List[Dict]:
         """Generate embeddings for code chunks"""
@@ -122,18 +142,25 @@ class CodeEmbedder:
                 texts.append(context_text)
             
             # Generate embeddings
-            logger.info(f"Generating embeddings for {len(texts)} chunks...")
-            embeddings = self.model.encode(texts, show_progress_bar=True)
+            logger.info("Generating embeddings for %d chunks...", len(texts))
+            embeddings = self.model.encode(
+                texts,
+                batch_size=EMBED_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
             
-            # Add embeddings to chunks
-            for i, chunk in enumerate(chunks):
-                chunk['embedding'] = embeddings[i].tolist()
+            # Attach rows of the float32 matrix; they are converted to lists
+            # once, when the vector store hands them to Chroma
+            for chunk, embedding in zip(chunks, embeddings):
+                chunk['embedding'] = embedding
             
             logger.info("Successfully generated embeddings")
             return chunks
             
         except Exception as e:
-            logger.error(f"Failed to generate embeddings: {e}")
+            logger.error("Failed to generate embeddings: %s", e)
             raise
 
     def process_uploaded_files(self, files_data: List[Dict]) -> List[Dict]:
@@ -143,42 +170,142 @@ class CodeEmbedder:
         """
         all_chunks = []
         
-        for file_data in files_data:
-            filename = file_data['name']
-            
-            # Skip non-React files
-            if not filename.endswith(('.js', '.jsx', '.ts', '.tsx')):
-                continue
-                
-            try:
-                # Decode base64 content
-                content = base64.b64decode(file_data['content']).decode('utf-8')
-                
-                # Skip empty files
-                if not content.strip():
-                    continue
-                
-                # Chunk the code
-                chunks = self.smart_chunk_code(content, filename)
-                all_chunks.extend(chunks)
-                
-            except Exception as e:
-                logger.warning(f"Failed to process file {filename}: {e}")
-                continue
+        # Decoding and chunking is pure CPU work, so large uploads are spread
+        # across processes before the single batched embedding call
+        if len(files_data) >= PARALLEL_CHUNK_MIN_FILES:
+            per_file = _get_chunk_pool().map(decode_and_chunk, files_data, chunksize=8)
+        else:
+            per_file = map(decode_and_chunk, files_data)
+        
+        for chunks in per_file:
+            all_chunks.extend(chunks)
         
         # Generate embeddings for all chunks
         if all_chunks:
             all_chunks = self.embed_chunks(all_chunks)
         
-        logger.info(f"Processed {len(files_data)} files into {len(all_chunks)} embedded chunks")
+        logger.info("Processed %d files into %d embedded chunks", len(files_data), len(all_chunks))
         return all_chunks
 
-# Global instance
+@lru_cache(maxsize=4096)
+def detect_chunk_type(code: str) -> str:
+    """Classify a chunk by the keywords it contains; repeated snippets are
+    served from the cache"""
+    found = {keyword.lower() for keyword in _CHUNK_KEYWORDS.findall(code)}
+    
+    if 'useeffect' in found or 'usestate' in found:
+        return 'react_hook'
+    elif 'function' in found and 'component' in found:
+        return 'react_component'
+    elif 'class' in found and 'extends' in found:
+        return 'class_component'
+    elif 'interface' in found or 'type' in found:
+        return 'typescript_definition'
+    elif 'export' in found:
+        return 'module_export'
+    elif 'import' in found:
+        return 'import_statement'
+    else:
+        return 'code_block'
+
+def chunk_code(code: str, filename: str, max_chunk_size: int = 500) -> List[Dict]:
+    """Split code into line-aligned chunks of at most max_chunk_size
+    characters; module level so worker processes can run it"""
+    chunks = []
+    
+    # Language detection based on file extension
+    if filename.endswith(('.tsx', '.jsx')):
+        lang = 'jsx'
+    elif filename.endswith('.ts'):
+        lang = 'typescript'
+    else:
+        lang = 'javascript'
+    
+    # Chunks are tracked as [start, i) ranges of lines and only joined when
+    # they are emitted
+    lines = code.split('\n')
+    start = 0
+    current_size = 0
+    
+    for i, line in enumerate(lines):
+        line_size = len(line)
+    
+        # If adding this line would exceed chunk size and we have content, create a chunk
+        if current_size + line_size > max_chunk_size and i > start:
+            chunk_text = '\n'.join(lines[start:i])
+            if chunk_text.strip():
+                chunks.append({
+                    'text': chunk_text,
+                    'filename': filename,
+                    'start_line': start + 1,
+                    'end_line': i,
+                    'language': lang,
+                    'type': detect_chunk_type(chunk_text)
+                })
+            start = i
+            current_size = 0
+    
+        current_size += line_size
+    
+    # Add the last chunk
+    if start < len(lines):
+        chunk_text = '\n'.join(lines[start:])
+        if chunk_text.strip():
+            chunks.append({
+                'text': chunk_text,
+                'filename': filename,
+                'start_line': start + 1,
+                'end_line': len(lines),
+                'language': lang,
+                'type': detect_chunk_type(chunk_text)
+            })
+    
+    logger.info("Created %d chunks from %s", len(chunks), filename)
+    return chunks
+
+def decode_and_chunk(file_data: Dict) -> List[Dict]:
+    """Decode one uploaded file and chunk it; skipped or unreadable files
+    give no chunks"""
+    filename = file_data['name']
+    
+    # Skip non-React files
+    if not filename.endswith(('.js', '.jsx', '.ts', '.tsx')):
+        return []
+    
+    try:
+        # Decode base64 content
+        content = base64.b64decode(file_data['content']).decode('utf-8')
+        
+        # Skip empty files
+        if not content.strip():
+            return []
+        
+        return chunk_code(content, filename)
+        
+    except Exception as e:
+        logger.warning("Failed to process file %s: %s", filename, e)
+        return []
+
+def _get_chunk_pool() -> ProcessPoolExecutor:
+    """Shared worker processes for chunking large uploads; spawned rather
+    than forked so they never inherit the server's threads or model"""
+    global _chunk_pool
+    with _chunk_pool_lock:
+        if _chunk_pool is None:
+            _chunk_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+        return _chunk_pool
+
+# Global instance, created under a lock so concurrent first calls build
+# only one
 _embedder = None
+_embedder_lock = threading.Lock()
 
-def get_embedder():
-    """Get or create the global embedder instance"""
+def get_embedder(device=None):
+    """Get or create the global embedder instance; device only applies when
+    it is created"""
     global _embedder
     if _embedder is None:
-        _embedder = CodeEmbedder()
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = CodeEmbedder(device=device)
     return _embedder
\ No newline at end of file
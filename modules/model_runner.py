@@ -1,46 +1,168 @@
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+from transformers import AutoConfig, AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, GPTQConfig, StaticCache, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+import os
+import re
+import time
+import copy
 import logging
-from typing import Optional, Dict
+import threading
+import importlib.util
+from typing import Optional, Dict, Iterator
 import gc
+import itertools
 
 logger = logging.getLogger(__name__)
 
+# torchao FP8 weight quantization for GPUs with FP8 tensor cores (Ada/Hopper)
+try:
+    from torchao.quantization import quantize_, float8_weight_only
+except ImportError:
+    quantize_ = None
+
+def fp8_available() -> bool:
+    """Whether FP8 weights can be used; called at load time, since querying
+    the device capability initializes CUDA in the calling process"""
+    return (
+        quantize_ is not None
+        and torch.cuda.is_available()
+        and torch.cuda.get_device_capability() >= (8, 9)
+    )
+
+# FlashAttention-2 kernels when flash-attn is installed on a GPU host,
+# otherwise PyTorch's fused scaled_dot_product_attention
+ATTN_IMPLEMENTATION = (
+    "flash_attention_2"
+    if torch.cuda.is_available() and importlib.util.find_spec("flash_attn") is not None
+    else "sdpa"
+)
+
+# Opt-in torch.compile of the decoder forward; the first compile is slow, so
+# point TORCHINDUCTOR_CACHE_DIR at a persistent directory to reuse it across
+# restarts
+COMPILE_MODEL = os.getenv('MODEL_COMPILE', '').lower() in ('1', 'true', 'yes')
+
+# Prompt truncation window and the largest generation a request can ask for;
+# together they size the preallocated KV cache of a compiled model
+MAX_PROMPT_TOKENS = 4000
+MAX_NEW_TOKENS = 1024
+
+# Prompt-lookup speculative decoding: candidate tokens are copied from n-gram
+# matches in the prompt and verified in one forward pass, which pays off on
+# code answers that repeat identifiers from the context. 0 disables it
+PROMPT_LOOKUP_TOKENS = int(os.getenv('PROMPT_LOOKUP_TOKENS', 10))
+
+# How long a memory usage reading is reused, so polling get_model_info
+# doesn't keep querying the CUDA allocator during generation
+MEMORY_USAGE_TTL = 1.0
+
+SYSTEM_PROMPT = """You are a senior React/TypeScript developer and architect with 10+ years of experience. You specialize in identifying bugs, performance issues, and providing best practices. Always provide:
+
+1. **Direct Answer**: Address the specific question first
+2. **Code Analysis**: Explain what the code is doing
+3. **Issues Found**: Identify any problems, bugs, or anti-patterns
+4. **Best Practices**: Suggest improvements and modern React patterns
+5. **Example Code**: Provide corrected or improved code examples when relevant
+
+Be concise but thorough. Focus on practical, actionable advice."""
+
+# Fixed sections of the prompt around the developer's question and context
+QUESTION_HEADER = "\n\n## Developer Question:\n"
+CONTEXT_HEADER = "\n\n## Relevant Code Context:\n"
+PROMPT_FOOTER = "\n\nPlease analyze this code and provide a detailed response addressing the question. Include specific code examples and best practices. [/INST]"
+
+# Requests tokenized both ways before the system prompt prefix is cached
+PARITY_SAMPLES = (
+    ("Why does this component re-render?", "const App = () => {\n  const [count, setCount] = useState(0);\n  return <div>{count}</div>;\n};"),
+    ("useEffect infinite loop", "function useData(url) {\n\tuseEffect(() => { fetch(url); });\n}"),
+)
+
+# Openings that already read as a structured answer
+ANSWER_MARKERS = ('##', '**', '1.', '-', '•')
+
+# Special tokens left in decoded text, and whitespace runs around line breaks
+_SPECIAL_TOKENS = re.compile(r'</?s>|\[/?INST\]')
+_LINE_BREAKS = re.compile(r'\s*\n\s*')
+
+# Pre-quantized GPTQ/AWQ checkpoints run fused INT4 kernels; the fp16 base
+# model is loaded with bitsandbytes 4-bit if those can't be used
+MODEL_NAME = os.getenv('MISTRAL_MODEL', "TheBloke/Mistral-7B-Instruct-v0.2-GPTQ")
+BASE_MODEL_NAME = os.getenv('MISTRAL_BASE_MODEL', "mistralai/Mistral-7B-Instruct-v0.2")
+
+class _CancelGeneration(StoppingCriteria):
+    """Stops generate() once the given event is set"""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
 class MistralCodeAnalyzer:
-    def __init__(self, model_name: str = "mistralai/Mistral-7B-Instruct-v0.2"):
+    def __init__(self, model_name: str = MODEL_NAME):
         """Initialize Mistral-7B with quantization for efficiency"""
         self.model_name = model_name
         self.tokenizer = None
         self.model = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        # Fixed-shape KV cache reused across calls once the model is compiled;
+        # generation is serialized while it is shared
+        self.static_cache = None
+        self.generate_lock = threading.Lock()
+        # Token ids and KV cache of the default system prompt prefix
+        self.system_prefix_ids = None
+        self.system_kv = None
+        self.memory_usage = {}
+        self.memory_usage_at = None
         
-        logger.info(f"Initializing Mistral model on device: {self.device}")
+        logger.info("Initializing Mistral model on device: %s", self.device)
         self._load_model()
+        if COMPILE_MODEL and self.model is not None:
+            self._compile_model()
+        if self.model is not None and self.static_cache is None:
+            self._cache_system_prompt()
+
+    def _load_tokenizer(self):
+        """Load the tokenizer for the current model name"""
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            self.model_name,
+            trust_remote_code=True
+        )
+        
+        # Add padding token if not present
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
 
     def _load_model(self):
         """Load the model with quantization to save memory"""
         try:
-            # Load tokenizer
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                self.model_name,
-                trust_remote_code=True
-            )
+            self._load_tokenizer()
             
-            # Add padding token if not present
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
+            # Checkpoints quantized offline carry their own quantization config
+            quant_method = getattr(
+                AutoConfig.from_pretrained(self.model_name, trust_remote_code=True),
+                'quantization_config', {}
+            ).get('quant_method')
             
-            # Configure quantization for memory efficiency
-            quantization_config = BitsAndBytesConfig(
-                load_in_4bit=True,
-                bnb_4bit_compute_dtype=torch.float16,
-                bnb_4bit_use_double_quant=True,
-                bnb_4bit_quant_type="nf4"
-            )
+            # Unquantized checkpoints use FP8 weights where the GPU runs FP8
+            # matmuls natively, avoiding NF4's per-matmul dequantization
+            use_fp8 = quant_method is None and fp8_available()
+            
+            if quant_method == "gptq":
+                # ExLlama-v2 kernels fuse dequantization into the INT4 GEMM
+                quantization_config = GPTQConfig(bits=4, use_exllama=True, exllama_config={"version": 2})
+            elif quant_method is not None or use_fp8:
+                quantization_config = None
+            else:
+                # Configure quantization for memory efficiency
+                quantization_config = BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_compute_dtype=torch.float16,
+                    bnb_4bit_use_double_quant=True,
+                    bnb_4bit_quant_type="nf4"
+                )
             
             # Load model with quantization
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_name,
+            self.model = self._from_pretrained(
                 quantization_config=quantization_config,
                 device_map="auto",
                 torch_dtype=torch.float16,
@@ -48,20 +170,49 @@ class MistralCodeAnalyzer:
                 low_cpu_mem_usage=True
             )
             
-            logger.info("Mistral-7B model loaded successfully with 4-bit quantization")
+            if use_fp8:
+                quantize_(self.model, float8_weight_only())
+                logger.info("Mistral-7B model loaded successfully with FP8 weights")
+            else:
+                logger.info("Mistral-7B model loaded successfully with 4-bit %s quantization", quant_method or "bnb")
             
         except Exception as e:
-            logger.error(f"Failed to load Mistral model: {e}")
-            # Fallback: try loading without quantization
+            logger.error("Failed to load Mistral model: %s", e)
+            # Fallback: try the base model with bitsandbytes, then unquantized
             self._load_model_fallback()
 
     def _load_model_fallback(self):
-        """Fallback: load model without quantization"""
+        """Fallback: load the base model with bitsandbytes 4-bit, then
+        without quantization"""
+        if self.model_name != BASE_MODEL_NAME:
+            self.model_name = BASE_MODEL_NAME
+            self._load_tokenizer()
+            
+            if self.device == "cuda":
+                try:
+                    logger.info("Attempting fallback model loading with bitsandbytes 4-bit...")
+                    self.model = self._from_pretrained(
+                        quantization_config=BitsAndBytesConfig(
+                            load_in_4bit=True,
+                            bnb_4bit_compute_dtype=torch.float16,
+                            bnb_4bit_use_double_quant=True,
+                            bnb_4bit_quant_type="nf4"
+                        ),
+                        device_map="auto",
+                        torch_dtype=torch.float16,
+                        trust_remote_code=True,
+                        low_cpu_mem_usage=True
+                    )
+                    logger.info("Base model loaded successfully with bitsandbytes 4-bit quantization")
+                    return
+                    
+                except Exception as e:
+                    logger.error("bitsandbytes fallback failed: %s", e)
+        
         try:
             logger.info("Attempting fallback model loading without quantization...")
             
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_name,
+            self.model = self._from_pretrained(
                 torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
                 device_map="auto" if self.device == "cuda" else None,
                 trust_remote_code=True,
@@ -74,37 +225,195 @@ class MistralCodeAnalyzer:
             logger.info("Model loaded successfully without quantization")
             
         except Exception as e:
-            logger.error(f"Fallback model loading also failed: {e}")
+            logger.error("Fallback model loading also failed: %s", e)
             raise
 
-    def create_prompt(self, query: str, context: str, obfuscated_prompt: str = "") -> str:
-        """Create a well-structured prompt for code analysis"""
+    def _from_pretrained(self, **kwargs):
+        """Load the model with the fastest available attention kernel,
+        retrying with SDPA if FlashAttention-2 can't be used"""
+        attn_implementation = ATTN_IMPLEMENTATION
+        if kwargs.get('torch_dtype') == torch.float32:
+            # FlashAttention-2 only runs in half precision
+            attn_implementation = "sdpa"
         
-        system_prompt = """You are a senior React/TypeScript developer and architect with 10+ years of experience. You specialize in identifying bugs, performance issues, and providing best practices. Always provide:
+        try:
+            return AutoModelForCausalLM.from_pretrained(
+                self.model_name, attn_implementation=attn_implementation, **kwargs
+            )
+        except (ImportError, ValueError) as e:
+            if attn_implementation == "sdpa":
+                raise
+            logger.warning("FlashAttention-2 unavailable, using SDPA: %s", e)
+            return AutoModelForCausalLM.from_pretrained(
+                self.model_name, attn_implementation="sdpa", **kwargs
+            )
 
-1. **Direct Answer**: Address the specific question first
-2. **Code Analysis**: Explain what the code is doing
-3. **Issues Found**: Identify any problems, bugs, or anti-patterns
-4. **Best Practices**: Suggest improvements and modern React patterns
-5. **Example Code**: Provide corrected or improved code examples when relevant
+    def _compile_model(self):
+        """Compile the forward pass to cut per-token dispatch overhead during
+        decoding, then warm it up so the first query doesn't pay for it. A
+        static KV cache keeps decode shapes fixed so the step is captured as
+        a CUDA graph"""
+        # The instance's forward may already be wrapped by accelerate hooks
+        # from device_map, so that bound method is what gets restored
+        original_forward = self.model.forward
+        try:
+            self.model.forward = torch.compile(
+                original_forward, mode="reduce-overhead", dynamic=True
+            )
+            self.static_cache = StaticCache(
+                config=self.model.config,
+                max_batch_size=1,
+                max_cache_len=MAX_PROMPT_TOKENS + MAX_NEW_TOKENS,
+                device=self.model.device,
+                dtype=torch.float16
+            )
+            
+            warmup = self.tokenizer("[INST] Hello [/INST]", return_tensors="pt").to(self.model.device)
+            with torch.no_grad():
+                self.model.generate(
+                    **warmup,
+                    max_new_tokens=8,
+                    do_sample=False,
+                    pad_token_id=self.tokenizer.pad_token_id,
+                    past_key_values=self.static_cache
+                )
+            self.static_cache.reset()
+            logger.info("Model forward compiled with torch.compile")
+            
+        except Exception as e:
+            logger.warning("torch.compile failed, running eagerly: %s", e)
+            self.model.forward = original_forward
+            self.static_cache = None
 
-Be concise but thorough. Focus on practical, actionable advice."""
+    def _prompt_prefix(self, system_prompt: str) -> str:
+        """Instruction header shared by every prompt with this system prompt"""
+        return f"<s>[INST] {system_prompt}{QUESTION_HEADER}"
 
+    def create_prompt(self, query: str, context: str, obfuscated_prompt: str = "") -> str:
+        """Create a well-structured prompt for code analysis"""
         # Use obfuscated prompt if provided, otherwise use default
-        if obfuscated_prompt.strip():
-            system_prompt = obfuscated_prompt.strip()
+        system_prompt = obfuscated_prompt.strip() or SYSTEM_PROMPT
+        return f"{self._prompt_prefix(system_prompt)}{query}{CONTEXT_HEADER}{context}{PROMPT_FOOTER}"
 
-        prompt = f"""<s>[INST] {system_prompt}
+    def _cache_system_prompt(self):
+        """Prefill the default system prompt once and keep its KV cache, so
+        requests using it only tokenize and prefill what follows it"""
+        try:
+            if not self.tokenizer.is_fast:
+                # Trimming the context needs token offsets
+                logger.info("Slow tokenizer, system prompt not cached")
+                return
+            
+            self.system_prefix_ids = self.tokenizer(
+                self._prompt_prefix(SYSTEM_PROMPT), return_tensors="pt"
+            ).input_ids.to(self.model.device)
+            
+            # The cached KV is only valid if prefix + suffix tokenize exactly
+            # like the full prompt
+            for query, context in PARITY_SAMPLES:
+                full_ids = self.tokenizer(self.create_prompt(query, context)).input_ids
+                if self._default_prompt_ids(query, context)[0].tolist() != full_ids:
+                    logger.warning("Split prompt tokenization differs from the full prompt, system prompt not cached")
+                    self.system_prefix_ids = None
+                    return
+            
+            with torch.no_grad():
+                self.system_kv = self.model(self.system_prefix_ids, use_cache=True).past_key_values
+            logger.info("System prompt cached (%d tokens)", self.system_prefix_ids.shape[1])
+            
+        except Exception as e:
+            logger.warning("Failed to cache system prompt: %s", e)
+            self.system_prefix_ids = None
+            self.system_kv = None
 
-## Developer Question:
-{query}
+    def _default_prompt_ids(self, query: str, context: str):
+        """Token ids for a default-system-prompt request. Everything after the
+        cached prefix is tokenized in one call, so it merges the same way as
+        in the full prompt; an over-long context is cut so the footer stays
+        intact"""
+        budget = MAX_PROMPT_TOKENS - self.system_prefix_ids.shape[1]
+        suffix = f"{query}{CONTEXT_HEADER}{context}{PROMPT_FOOTER}"
+        encoding = self.tokenizer(suffix, add_special_tokens=False, return_offsets_mapping=True)
+        suffix_ids = encoding.input_ids
+        
+        excess = len(suffix_ids) - budget
+        if excess > 0:
+            # Drop the context's last tokens by cutting its text where the
+            # first dropped token starts, then tokenize the shorter suffix
+            context_start = len(query) + len(CONTEXT_HEADER)
+            context_end = context_start + len(context)
+            token_starts = [
+                start for start, _ in encoding.offset_mapping
+                if context_start <= start < context_end
+            ]
+            keep = max(len(token_starts) - excess, 0)
+            if keep < len(token_starts):
+                context = context[:token_starts[keep] - context_start]
+            suffix = f"{query}{CONTEXT_HEADER}{context}{PROMPT_FOOTER}"
+            suffix_ids = self.tokenizer(suffix, add_special_tokens=False).input_ids[:budget]
+        
+        request_ids = self._to_device(torch.tensor([suffix_ids], dtype=torch.long))
+        return torch.cat([self.system_prefix_ids, request_ids], dim=1)
 
-## Relevant Code Context:
-{context}
+    def _to_device(self, tensor: torch.Tensor) -> torch.Tensor:
+        """Copy a CPU tensor to the model's device, through page-locked
+        memory on GPUs so the host doesn't wait for the copy"""
+        if self.model.device.type != "cuda":
+            return tensor.to(self.model.device)
+        return tensor.pin_memory().to(self.model.device, non_blocking=True)
 
-Please analyze this code and provide a detailed response addressing the question. Include specific code examples and best practices. [/INST]"""
+    def _prepare_inputs(self, query: str, context: str, obfuscated_prompt: str = "") -> Dict:
+        """Build the generate() inputs for a request"""
+        if self.system_kv is not None and not obfuscated_prompt.strip():
+            # Only the question and context are tokenized; the cached
+            # system prompt prefix is reused as-is
+            input_ids = self._default_prompt_ids(query, context)
+            return {
+                'input_ids': input_ids,
+                'attention_mask': torch.ones_like(input_ids),
+                'past_key_values': copy.deepcopy(self.system_kv)
+            }
+        
+        # Create prompt
+        prompt = self.create_prompt(query, context, obfuscated_prompt)
+        
+        # Tokenize
+        inputs = self.tokenizer(
+            prompt,
+            return_tensors="pt",
+            truncation=True,
+            max_length=MAX_PROMPT_TOKENS,  # Leave room for generation
+            padding=True
+        )
+        return {name: self._to_device(tensor) for name, tensor in inputs.items()}
 
-        return prompt
+    def _generate(self, inputs: Dict, max_tokens: int, **kwargs):
+        """Run model.generate with the shared sampling settings"""
+        generate_kwargs = dict(
+            max_new_tokens=max_tokens,
+            do_sample=True,
+            temperature=0.7,
+            top_p=0.9,
+            pad_token_id=self.tokenizer.pad_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+            repetition_penalty=1.1,
+            **kwargs
+        )
+        
+        if self.static_cache is not None:
+            # Reuse the preallocated cache, which only has room for
+            # MAX_NEW_TOKENS after a full prompt
+            generate_kwargs['max_new_tokens'] = min(max_tokens, MAX_NEW_TOKENS)
+            with self.generate_lock, torch.no_grad():
+                self.static_cache.reset()
+                return self.model.generate(
+                    **inputs, **generate_kwargs, past_key_values=self.static_cache
+                )
+        
+        if PROMPT_LOOKUP_TOKENS:
+            generate_kwargs['prompt_lookup_num_tokens'] = PROMPT_LOOKUP_TOKENS
+        with torch.no_grad():
+            return self.model.generate(**inputs, **generate_kwargs)
 
     def generate_response(self, query: str, context: str, obfuscated_prompt: str = "", max_tokens: int = 1024) -> str:
         """Generate AI response for code analysis"""
@@ -112,31 +421,11 @@ Please analyze this code and provide a detailed response addressing the question
             if not self.model or not self.tokenizer:
                 return "❌ Model not loaded. Please check the logs for initialization errors."
             
-            # Create prompt
-            prompt = self.create_prompt(query, context, obfuscated_prompt)
-            
-            # Tokenize
-            inputs = self.tokenizer(
-                prompt,
-                return_tensors="pt",
-                truncation=True,
-                max_length=4000,  # Leave room for generation
-                padding=True
-            ).to(self.model.device)
+            inputs = self._prepare_inputs(query, context, obfuscated_prompt)
             
             # Generate response
             logger.info("Generating response...")
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=max_tokens,
-                    do_sample=True,
-                    temperature=0.7,
-                    top_p=0.9,
-                    pad_token_id=self.tokenizer.pad_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id,
-                    repetition_penalty=1.1
-                )
+            outputs = self._generate(inputs, max_tokens)
             
             # Decode response
             full_response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
@@ -150,29 +439,94 @@ Please analyze this code and provide a detailed response addressing the question
             # Clean up response
             response = self._clean_response(response)
             
-            logger.info(f"Generated response ({len(response)} characters)")
+            logger.info("Generated response (%d characters)", len(response))
             return response
             
         except Exception as e:
-            logger.error(f"Generation failed: {e}")
+            logger.error("Generation failed: %s", e)
             return f"❌ Error generating response: {str(e)}\n\nQuery: {query}\nContext available: {len(context)} characters"
 
+    def stream_response(self, query: str, context: str, obfuscated_prompt: str = "", max_tokens: int = 1024) -> Iterator[str]:
+        """Generate AI response for code analysis, yielding cleaned text as
+        the model produces it"""
+        if not self.model or not self.tokenizer:
+            yield "❌ Model not loaded. Please check the logs for initialization errors."
+            return
+        
+        try:
+            inputs = self._prepare_inputs(query, context, obfuscated_prompt)
+        except Exception as e:
+            logger.error("Generation failed: %s", e)
+            yield f"❌ Error generating response: {str(e)}"
+            return
+        
+        # The streamer only receives new tokens, so no prompt is decoded
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        # Set when the consumer stops early so generation ends at the next
+        # token instead of running to max_tokens
+        cancelled = threading.Event()
+        
+        def run():
+            try:
+                self._generate(
+                    inputs, max_tokens, streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_CancelGeneration(cancelled)])
+                )
+            except Exception as e:
+                logger.error("Generation failed: %s", e)
+                streamer.end()
+        
+        logger.info("Streaming response...")
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            yield from self._clean_stream(streamer)
+        finally:
+            cancelled.set()
+            thread.join()
+
     def _clean_response(self, response: str) -> str:
         """Clean and format the AI response"""
         # Remove any remaining special tokens
-        response = response.replace("<s>", "").replace("</s>", "")
-        response = response.replace("[INST]", "").replace("[/INST]", "")
+        response = _SPECIAL_TOKENS.sub('', response)
         
-        # Remove excessive whitespace
-        lines = [line.strip() for line in response.split('\n')]
-        response = '\n'.join(line for line in lines if line)
+        # Remove excessive whitespace and blank lines
+        response = _LINE_BREAKS.sub('\n', response).strip()
         
         # Ensure it starts with a clear answer
-        if not response.startswith(('##', '**', '1.', '-', '•')):
+        if not response.startswith(ANSWER_MARKERS):
             response = f"## Analysis\n\n{response}"
         
         return response
 
+    def _clean_stream(self, chunks: Iterator[str]) -> Iterator[str]:
+        """Clean streamed text a line at a time, producing the same text as
+        _clean_response once joined"""
+        pending = ''
+        started = False
+        # A trailing newline flushes the last partial line
+        for chunk in itertools.chain(chunks, ['\n']):
+            pending += chunk
+            *lines, pending = pending.split('\n')
+            for line in lines:
+                line = self._clean_line(line)
+                if not line:
+                    continue
+                if started:
+                    yield f"\n{line}"
+                else:
+                    started = True
+                    # Ensure it starts with a clear answer
+                    yield line if line.startswith(ANSWER_MARKERS) else f"## Analysis\n\n{line}"
+        
+        if not started:
+            yield "## Analysis\n\n"
+
+    @staticmethod
+    def _clean_line(line: str) -> str:
+        """Strip special tokens and surrounding whitespace from one line"""
+        return _SPECIAL_TOKENS.sub('', line).strip()
+
     def get_model_info(self) -> Dict:
         """Get information about the loaded model"""
         return {
@@ -184,15 +538,23 @@ Please analyze this code and provide a detailed response addressing the question
             'memory_usage': self._get_memory_usage()
         }
 
-    def _get_memory_usage(self) -> Dict:
-        """Get current memory usage"""
+    def _get_memory_usage(self, force: bool = False) -> Dict:
+        """Get current memory usage, reusing a reading up to MEMORY_USAGE_TTL
+        seconds old unless force is set"""
+        now = time.monotonic()
+        if not force and self.memory_usage_at is not None and now - self.memory_usage_at < MEMORY_USAGE_TTL:
+            return dict(self.memory_usage)
+        
         memory_info = {}
         
         if torch.cuda.is_available():
-            memory_info['cuda_allocated'] = f"{torch.cuda.memory_allocated() / 1024**3:.2f} GB"
-            memory_info['cuda_reserved'] = f"{torch.cuda.memory_reserved() / 1024**3:.2f} GB"
+            stats = torch.cuda.memory_stats()
+            memory_info['cuda_allocated'] = f"{stats.get('allocated_bytes.all.current', 0) / 1024**3:.2f} GB"
+            memory_info['cuda_reserved'] = f"{stats.get('reserved_bytes.all.current', 0) / 1024**3:.2f} GB"
         
-        return memory_info
+        self.memory_usage = memory_info
+        self.memory_usage_at = now
+        return dict(memory_info)
 
     def cleanup(self):
         """Clean up model resources"""
@@ -209,21 +571,26 @@ Please analyze this code and provide a detailed response addressing the question
             logger.info("Model resources cleaned up")
             
         except Exception as e:
-            logger.warning(f"Cleanup warning: {e}")
+            logger.warning("Cleanup warning: %s", e)
 
-# Global instance
+# Global instance, created under a lock so concurrent first calls build
+# only one
 _model_runner = None
+_model_runner_lock = threading.Lock()
 
 def get_model_runner():
     """Get or create the global model runner instance"""
     global _model_runner
     if _model_runner is None:
-        _model_runner = MistralCodeAnalyzer()
+        with _model_runner_lock:
+            if _model_runner is None:
+                _model_runner = MistralCodeAnalyzer()
     return _model_runner
 
 def cleanup_model():
     """Cleanup the global model instance"""
     global _model_runner
-    if _model_runner:
-        _model_runner.cleanup()
-        _model_runner = None
\ No newline at end of file
+    with _model_runner_lock:
+        if _model_runner:
+            _model_runner.cleanup()
+            _model_runner = None
\ No newline at end of file
@@ -1,9 +1,80 @@
 import re
+import copy
+import heapq
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
 from typing import List, Dict, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Query expansions in the order they are applied; each rule fires once when
+# any of its lowercase triggers appears in the query
+_QUERY_EXPANSIONS = (
+    (('useeffect',), (
+        '{query} dependency array',
+        '{query} cleanup function',
+        'useEffect infinite loop'
+    )),
+    (('usestate',), (
+        '{query} state update',
+        '{query} functional update',
+        'useState asynchronous'
+    )),
+    (('infinite', 'loop'), (
+        'useEffect dependency array',
+        'missing dependencies',
+        'useCallback memoization'
+    )),
+    (('render',), (
+        'React.memo optimization',
+        'useMemo performance',
+        'unnecessary re-render'
+    )),
+    # TypeScript specific terms
+    (('type', 'interface', 'generic'), (
+        '{query} TypeScript',
+        '{query} type definition'
+    )),
+)
+
+# pyahocorasick finds every trigger in one pass over the query
+try:
+    import ahocorasick
+    _TRIGGER_AUTOMATON = ahocorasick.Automaton()
+    for _rule, (_triggers, _) in enumerate(_QUERY_EXPANSIONS):
+        for _trigger in _triggers:
+            _TRIGGER_AUTOMATON.add_word(_trigger, _rule)
+    _TRIGGER_AUTOMATON.make_automaton()
+except ImportError:
+    _TRIGGER_AUTOMATON = None
+
+# Recent retrievals kept per retriever, keyed by session and normalized query
+RESULTS_CACHE_SIZE = 256
+
+@lru_cache(maxsize=1024)
+def _expand_query(query: str) -> tuple:
+    """Expanded search queries for a query; a pure function of its text"""
+    enhanced_queries = [query]
+    query_lower = query.lower()
+    
+    # Add React-specific enhancements
+    if _TRIGGER_AUTOMATON is not None:
+        fired = {rule for _, rule in _TRIGGER_AUTOMATON.iter(query_lower)}
+    else:
+        fired = {
+            rule for rule, (triggers, _) in enumerate(_QUERY_EXPANSIONS)
+            if any(trigger in query_lower for trigger in triggers)
+        }
+    
+    for rule in sorted(fired):
+        enhanced_queries.extend(
+            expansion.format(query=query) for expansion in _QUERY_EXPANSIONS[rule][1]
+        )
+    
+    return tuple(enhanced_queries)
+
 class CodeRetriever:
     def __init__(self):
         """Initialize the code retriever"""
@@ -13,51 +84,15 @@ class CodeRetriever:
             'patterns': ['HOC', 'render props', 'context', 'provider', 'consumer'],
             'issues': ['infinite loop', 're-render', 'memory leak', 'stale closure', 'dependency array']
         }
+        # (session_id, normalized query, max_chunks, store generation) -> chunks
+        self.results_cache = OrderedDict()
+        self.results_lock = threading.Lock()
 
     def enhance_query(self, query: str) -> List[str]:
         """
         Enhance the user query with related terms for better retrieval
         """
-        enhanced_queries = [query]
-        query_lower = query.lower()
-        
-        # Add React-specific enhancements
-        if 'useeffect' in query_lower:
-            enhanced_queries.extend([
-                query + ' dependency array',
-                query + ' cleanup function',
-                'useEffect infinite loop'
-            ])
-        
-        if 'usestate' in query_lower:
-            enhanced_queries.extend([
-                query + ' state update',
-                query + ' functional update',
-                'useState asynchronous'
-            ])
-        
-        if 'infinite' in query_lower or 'loop' in query_lower:
-            enhanced_queries.extend([
-                'useEffect dependency array',
-                'missing dependencies',
-                'useCallback memoization'
-            ])
-        
-        if 'render' in query_lower:
-            enhanced_queries.extend([
-                'React.memo optimization',
-                'useMemo performance',
-                'unnecessary re-render'
-            ])
-        
-        # Add TypeScript specific terms
-        if any(ts_term in query_lower for ts_term in ['type', 'interface', 'generic']):
-            enhanced_queries.extend([
-                query + ' TypeScript',
-                query + ' type definition'
-            ])
-        
-        return enhanced_queries
+        return list(_expand_query(query))
 
     def retrieve_relevant_chunks(self, query: str, session_id: str, max_chunks: int = 8) -> List[Dict]:
         """
@@ -67,77 +102,114 @@ class CodeRetriever:
             from .chromadb_store import get_vector_store
             vector_store = get_vector_store()
             
+            # Repeated questions skip the search; case and spacing don't
+            # change the embeddings or scores. The store generation is shared
+            # by every worker, so a re-upload handled by any process makes
+            # older entries unreachable
+            cache_key = (session_id, ' '.join(query.lower().split()), max_chunks, vector_store.generation)
+            with self.results_lock:
+                cached = self.results_cache.get(cache_key)
+                if cached is not None:
+                    self.results_cache.move_to_end(cache_key)
+                    logger.info("Retrieved %d cached chunks for query: %.50s...", len(cached), query)
+                    return copy.deepcopy(list(cached))
+            
             # Enhance the query
             enhanced_queries = self.enhance_query(query)
             
-            all_chunks = []
-            seen_chunks = set()
+            # Search with the first few enhanced queries in one batch
+            results = vector_store.search_similar_chunks_batch(
+                enhanced_queries[:3],  # Limit to avoid too many searches
+                session_id,
+                top_k=max_chunks
+            )
             
-            # Search with each enhanced query
-            for enhanced_query in enhanced_queries[:3]:  # Limit to avoid too many searches
-                chunks = vector_store.search_similar_chunks(
-                    enhanced_query, 
-                    session_id, 
-                    top_k=max_chunks
-                )
-                
-                # Add unique chunks
+            # Keep the first hit for each chunk
+            unique_chunks = {}
+            for chunks in results:
                 for chunk in chunks:
-                    chunk_key = f"{chunk['filename']}:{chunk['start_line']}"
-                    if chunk_key not in seen_chunks:
-                        chunk['relevance_score'] = self._calculate_relevance(query, chunk)
-                        all_chunks.append(chunk)
-                        seen_chunks.add(chunk_key)
+                    unique_chunks.setdefault(f"{chunk['filename']}:{chunk['start_line']}", chunk)
             
-            # Sort by relevance and distance
-            all_chunks.sort(key=lambda x: (x['relevance_score'], -x['distance']), reverse=True)
+            all_chunks = list(unique_chunks.values())
+            terms = self._query_terms(query)
+            for chunk in all_chunks:
+                chunk['relevance_score'] = self._score_chunk(terms, chunk)
             
-            # Return top chunks
-            result_chunks = all_chunks[:max_chunks]
+            # Return top chunks by relevance and distance
+            result_chunks = heapq.nlargest(
+                max_chunks, all_chunks, key=lambda x: (x['relevance_score'], -x['distance'])
+            )
             
-            logger.info(f"Retrieved {len(result_chunks)} relevant chunks for query: {query[:50]}...")
+            with self.results_lock:
+                self.results_cache[cache_key] = tuple(copy.deepcopy(result_chunks))
+                while len(self.results_cache) > RESULTS_CACHE_SIZE:
+                    self.results_cache.popitem(last=False)
+            
+            logger.info("Retrieved %d relevant chunks for query: %.50s...", len(result_chunks), query)
             return result_chunks
             
         except Exception as e:
-            logger.error(f"Retrieval failed: {e}")
+            logger.error("Retrieval failed: %s", e)
             return []
 
     def _calculate_relevance(self, query: str, chunk: Dict) -> float:
         """
         Calculate relevance score based on query and chunk content
         """
-        score = 0.0
+        return self._score_chunk(self._query_terms(query), chunk)
+
+    def _query_terms(self, query: str) -> Dict:
+        """
+        Pre-compute the query side of the relevance score once per retrieval
+        """
         query_lower = query.lower()
-        chunk_text = chunk['text'].lower()
-        chunk_type = chunk['metadata'].get('type', '')
-        
-        # Exact keyword matches
-        query_words = query_lower.split()
-        for word in query_words:
-            if word in chunk_text:
-                score += 1.0
         
         # React-specific bonuses
-        if 'useeffect' in query_lower and 'useeffect' in chunk_text:
-            score += 2.0
+        keyword_bonuses = []
+        if 'useeffect' in query_lower:
+            keyword_bonuses.append((('useeffect',), 2.0))
         
-        if 'usestate' in query_lower and 'usestate' in chunk_text:
-            score += 2.0
+        if 'usestate' in query_lower:
+            keyword_bonuses.append((('usestate',), 2.0))
         
-        if 'infinite' in query_lower and ('dependency' in chunk_text or 'useeffect' in chunk_text):
-            score += 1.5
+        if 'infinite' in query_lower:
+            keyword_bonuses.append((('dependency', 'useeffect'), 1.5))
         
         # Type-based bonuses
-        if chunk_type == 'react_hook' and any(hook in query_lower for hook in ['hook', 'useeffect', 'usestate']):
-            score += 1.0
+        type_bonus = {}
+        if any(hook in query_lower for hook in ['hook', 'useeffect', 'usestate']):
+            type_bonus['react_hook'] = 1.0
+        
+        if 'component' in query_lower:
+            type_bonus['react_component'] = 1.0
         
-        if chunk_type == 'react_component' and 'component' in query_lower:
-            score += 1.0
+        if any(ts_term in query_lower for ts_term in ['type', 'interface']):
+            type_bonus['typescript_definition'] = 1.0
+        
+        return {
+            # Every occurrence of a repeated word counts
+            'word_counts': Counter(query_lower.split()),
+            'keyword_bonuses': keyword_bonuses,
+            'type_bonus': type_bonus
+        }
+
+    def _score_chunk(self, terms: Dict, chunk: Dict) -> float:
+        """
+        Score one chunk against pre-computed query terms
+        """
+        chunk_text = chunk['text'].lower()
+        
+        # Exact keyword matches
+        score = 0.0
+        for word, count in terms['word_counts'].items():
+            if word in chunk_text:
+                score += count
         
-        if chunk_type == 'typescript_definition' and any(ts_term in query_lower for ts_term in ['type', 'interface']):
-            score += 1.0
+        for needles, bonus in terms['keyword_bonuses']:
+            if any(needle in chunk_text for needle in needles):
+                score += bonus
         
-        return score
+        return score + terms['type_bonus'].get(chunk['metadata'].get('type', ''), 0.0)
 
     def format_context_for_ai(self, chunks: List[Dict], query: str) -> str:
         """
@@ -155,9 +227,10 @@ class CodeRetriever:
             end_line = chunk['metadata'].get('end_line', 0)
             chunk_type = chunk['metadata'].get('type', 'code')
             
-            # Extract just the code part (remove filename prefix)
-            text_lines = chunk['text'].split('\n')
-            code_text = '\n'.join(text_lines[1:]) if text_lines[0] == filename else chunk['text']
+            # Extract just the code part (remove filename prefix) without
+            # splitting the whole chunk into lines
+            first_line, _, rest = chunk['text'].partition('\n')
+            code_text = rest if first_line == filename else chunk['text']
             
             context_parts.append(f"### {i}. {filename} (lines {start_line}-{end_line}) - {chunk_type}")
             context_parts.append(f"```{chunk['metadata'].get('language', 'javascript')}")
@@ -183,12 +256,16 @@ class CodeRetriever:
             'average_relevance': sum(chunk.get('relevance_score', 0) for chunk in chunks) / len(chunks)
         }
 
-# Global instance
+# Global instance, created under a lock so concurrent first calls build
+# only one
 _retriever = None
+_retriever_lock = threading.Lock()
 
 def get_retriever():
     """Get or create the global retriever instance"""
     global _retriever
     if _retriever is None:
-        _retriever = CodeRetriever()
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = CodeRetriever()
     return _retriever
\ No newline at end of file
@@ -1 +1,145 @@
- 
+import io
+
+import pytest
+from flask import Flask, jsonify, request
+
+from config import app_config
+from config.app_config import CircuitBreaker, cached_page_view, init_request_limits, limit_body
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(app_config.time, 'monotonic', clock)
+    return clock
+
+
+def test_circuit_breaker_opens_after_fail_max(clock):
+    breaker = CircuitBreaker(fail_max=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.is_open
+    assert not breaker.allow()
+
+
+def test_circuit_breaker_lets_one_trial_through_per_timeout(clock):
+    breaker = CircuitBreaker(fail_max=1, reset_timeout=60)
+    breaker.record_failure()
+
+    clock.now += 59
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    # The trial restarts the cooldown
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.allow()
+
+
+def test_circuit_breaker_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(fail_max=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()
+
+
+@pytest.fixture
+def page_app(tmp_path):
+    (tmp_path / 'index.html').write_bytes(b'<h1>ragrail</h1>')
+    app = Flask(__name__, static_folder=str(tmp_path))
+    app.add_url_rule('/', 'index', cached_page_view(app, 'index.html'))
+    return app
+
+
+def test_cached_page_view_serves_page_with_etag(page_app):
+    response = page_app.test_client().get('/')
+    assert response.status_code == 200
+    assert response.data == b'<h1>ragrail</h1>'
+    assert response.mimetype == 'text/html'
+    assert response.headers['ETag']
+
+
+def test_cached_page_view_answers_conditional_requests(page_app):
+    client = page_app.test_client()
+    etag = client.get('/').headers['ETag']
+
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    response = client.get('/', headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+
+
+def test_cached_page_view_reads_file_once(page_app, tmp_path):
+    (tmp_path / 'index.html').write_bytes(b'changed')
+    assert page_app.test_client().get('/').data == b'<h1>ragrail</h1>'
+
+
+@pytest.fixture
+def limited_app():
+    app = Flask(__name__)
+    init_request_limits(app, max_bytes=100)
+
+    @app.route('/small', methods=['POST'])
+    @limit_body(10)
+    def small():
+        return jsonify({'received': len(request.get_data())})
+
+    @app.route('/default', methods=['POST'])
+    @limit_body()
+    def default():
+        return jsonify({'received': len(request.get_data())})
+
+    return app
+
+
+def post_chunked(client, path, body):
+    """POST body without a Content-Length, as a chunked upload arrives"""
+    return client.post(
+        path,
+        input_stream=io.BytesIO(body),
+        headers={'Transfer-Encoding': 'chunked'},
+        environ_overrides={'wsgi.input_terminated': True}
+    )
+
+
+@pytest.mark.parametrize('path, size, status', [
+    ('/small', 10, 200),
+    ('/small', 11, 413),
+    ('/default', 99, 200),
+    ('/default', 101, 413),
+])
+def test_limit_body_checks_declared_length(limited_app, path, size, status):
+    response = limited_app.test_client().post(path, data=b'x' * size)
+    assert response.status_code == status
+    if status == 413:
+        assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('path, size, status', [
+    ('/small', 10, 200),
+    ('/small', 11, 413),
+    ('/default', 99, 200),
+    ('/default', 100, 413),
+    ('/default', 500, 413),
+])
+def test_limit_body_caps_chunked_bodies(limited_app, path, size, status):
+    response = post_chunked(limited_app.test_client(), path, b'x' * size)
+    assert response.status_code == status
+    if status == 200:
+        assert response.get_json() == {'received': size}
@@ -0,0 +1,152 @@
+import logging
+import threading
+
+import pytest
+
+pytest.importorskip('chromadb')
+
+from modules.chromadb_store import CodeVectorStore, SessionIndex
+
+
+class FakeCollection:
+    """Collection returning fixed ids and metadata from get()"""
+
+    def __init__(self, ids, metadatas):
+        self.ids = ids
+        self.metadatas = metadatas
+        self.gets = 0
+
+    def get(self, include=None):
+        self.gets += 1
+        return {'ids': self.ids, 'metadatas': self.metadatas}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SessionIndex(str(tmp_path / 'index.sqlite3'))
+
+
+def test_session_index_build_scans_collection_once(tmp_path):
+    collection = FakeCollection(
+        ['a_0', 'a_1', 'b_0', 'orphan'],
+        [{'session_id': 'a', 'type': 'react_hook'}, {'session_id': 'a', 'type': 'code_block'},
+         {'session_id': 'b'}, {}]
+    )
+    path = str(tmp_path / 'index.sqlite3')
+    SessionIndex(path).build(collection)
+    # A second process opening the same file finds it built
+    SessionIndex(path).build(collection)
+
+    index = SessionIndex(path)
+    assert collection.gets == 1
+    assert index.file_types('a') == {'react_hook': 1, 'code_block': 1}
+    assert index.file_types('b') == {'unknown': 1}
+    assert index.file_types('missing') is None
+
+
+def test_session_index_old_sessions_oldest_first(index):
+    for session_id in ['s1', 's2', 's3', 's4']:
+        index.add(session_id, {f'{session_id}_0': 'code_block', f'{session_id}_1': 'code_block'})
+    # Re-storing a session keeps its original position
+    index.add('s1', {'s1_0': 'react_hook'})
+
+    old = index.old_sessions(keep_recent=2)
+    assert [session_id for session_id, _ in old] == ['s1', 's2']
+    assert sorted(old[0][1]) == ['s1_0', 's1_1']
+    assert index.old_sessions(keep_recent=10) == []
+
+
+def test_session_index_generation_tracks_changes(index):
+    assert index.generation == 0
+    index.add('s1', {'s1_0': 'code_block'})
+    assert index.generation == 1
+    index.add('s1', {'s1_1': 'code_block'}, bump=False)
+    assert index.generation == 1
+    index.remove('s1')
+    assert index.generation == 2
+    assert index.file_types('s1') is None
+    index.clear()
+    assert index.generation == 3
+
+
+def test_session_index_concurrent_adds(index):
+    def add(worker):
+        for i in range(20):
+            index.add(f'w{worker}', {f'w{worker}_{i}': 'code_block'})
+
+    threads = [threading.Thread(target=add, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert index.generation == 80
+    assert all(index.file_types(f'w{worker}') == {'code_block': 20} for worker in range(4))
+
+
+def chunk(filename, chunk_type, value):
+    return {'filename': filename, 'text': f'// {filename}', 'start_line': 1, 'end_line': 1,
+            'type': chunk_type, 'embedding': [value, 1.0 - value, 0.0]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CodeVectorStore(persist_directory=str(tmp_path / 'store'))
+
+
+def test_store_chunks_updates_index_and_generation(store):
+    generation = store.generation
+    session_id = store.store_chunks([chunk('A.tsx', 'react_hook', 0.1), chunk('B.ts', 'code_block', 0.9)])
+
+    assert store.generation > generation
+    stats = store.get_session_stats(session_id)
+    assert stats['total_chunks'] == 2
+    assert stats['file_types'] == {'react_hook': 1, 'code_block': 1}
+
+
+def test_restoring_a_session_with_fewer_chunks_drops_the_rest(store):
+    session_id = store.store_chunks([chunk(f'{i}.ts', 'code_block', 0.5) for i in range(3)])
+    store.store_chunks([chunk('0.ts', 'react_hook', 0.5)], session_id=session_id)
+
+    stats = store.get_session_stats(session_id)
+    assert stats['total_chunks'] == 1
+    assert stats['file_types'] == {'react_hook': 1}
+    assert store.session_index.chunk_ids(session_id) == [f'{session_id}_0']
+    assert store.collection.get(where={'session_id': session_id})['ids'] == [f'{session_id}_0']
+
+
+def test_session_stats_fall_back_to_collection_metadata(store):
+    session_id = store.store_chunks([chunk('A.tsx', 'react_hook', 0.1)])
+    # Chunks another process stored before this index knew about them
+    store.session_index.remove(session_id)
+
+    stats = store.get_session_stats(session_id)
+    assert stats['total_chunks'] == 1
+    assert stats['file_types'] == {'react_hook': 1}
+    assert store.session_index.file_types(session_id) == {'react_hook': 1}
+
+
+def test_cleanup_keeps_recent_sessions(store):
+    sessions = [store.store_chunks([chunk(f'{i}.ts', 'code_block', 0.5)]) for i in range(3)]
+    store.cleanup_old_sessions(keep_recent=1)
+
+    assert [store.get_session_stats(session_id)['total_chunks'] for session_id in sessions] == [0, 0, 1]
+
+
+def test_new_collection_uses_inner_product(store):
+    assert store.collection.metadata['hnsw:space'] == 'ip'
+
+
+def test_existing_collection_metadata_is_left_alone(tmp_path, caplog):
+    import chromadb
+    from chromadb.config import Settings
+
+    path = str(tmp_path / 'store')
+    client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False, allow_reset=True))
+    client.create_collection('react_code_chunks', metadata={'hnsw:space': 'l2'})
+
+    with caplog.at_level(logging.WARNING, logger='modules.chromadb_store'):
+        store = CodeVectorStore(persist_directory=path)
+
+    assert store.collection.metadata['hnsw:space'] == 'l2'
+    assert "uses 'l2' distance" in caplog.text
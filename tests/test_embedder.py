@@ -1 +1,134 @@
- 
+import base64
+import random
+
+import pytest
+
+from modules.embedder import chunk_code, decode_and_chunk, detect_chunk_type
+
+SNIPPETS = [
+    "import React, { useState } from 'react';",
+    "export default function Counter() {",
+    "  const [count, setCount] = useState(0);",
+    "  useEffect(() => { document.title = `${count}`; }, [count]);",
+    "class Legacy extends React.Component {",
+    "interface Props { label: string }",
+    "type Mode = 'light' | 'dark';",
+    "const handler = (event) => {",
+    "  return <button onClick={handler}>{label}</button>;",
+    "}",
+    "",
+    "   ",
+    "// " + "x" * 120,
+]
+
+
+def reference_detect_chunk_type(code):
+    """Keyword classification as originally written"""
+    code_lower = code.lower()
+    if 'useeffect' in code_lower or 'usestate' in code_lower:
+        return 'react_hook'
+    elif 'function' in code_lower and 'component' in code_lower:
+        return 'react_component'
+    elif 'class' in code_lower and 'extends' in code_lower:
+        return 'class_component'
+    elif 'interface' in code_lower or 'type' in code_lower:
+        return 'typescript_definition'
+    elif 'export' in code_lower:
+        return 'module_export'
+    elif 'import' in code_lower:
+        return 'import_statement'
+    return 'code_block'
+
+
+def reference_chunk_code(code, filename, max_chunk_size=500):
+    """Line-accumulating chunker as originally written"""
+    if filename.endswith(('.tsx', '.jsx')):
+        lang = 'jsx'
+    elif filename.endswith('.ts'):
+        lang = 'typescript'
+    else:
+        lang = 'javascript'
+
+    def chunk(lines, start_line, end_line):
+        text = '\n'.join(lines)
+        return {
+            'text': text,
+            'filename': filename,
+            'start_line': start_line,
+            'end_line': end_line,
+            'language': lang,
+            'type': reference_detect_chunk_type(text)
+        }
+
+    chunks = []
+    lines = code.split('\n')
+    current_chunk = []
+    current_size = 0
+    for i, line in enumerate(lines):
+        if current_size + len(line) > max_chunk_size and current_chunk:
+            if '\n'.join(current_chunk).strip():
+                chunks.append(chunk(current_chunk, i - len(current_chunk) + 1, i))
+            current_chunk = []
+            current_size = 0
+        current_chunk.append(line)
+        current_size += len(line)
+
+    if current_chunk and '\n'.join(current_chunk).strip():
+        chunks.append(chunk(current_chunk, len(lines) - len(current_chunk) + 1, len(lines)))
+    return chunks
+
+
+def random_code(rng):
+    return '\n'.join(rng.choice(SNIPPETS) for _ in range(rng.randint(0, 80)))
+
+
+def test_chunk_code_matches_reference_on_random_inputs():
+    rng = random.Random(0)
+    for _ in range(300):
+        code = random_code(rng)
+        filename = rng.choice(['App.tsx', 'util.ts', 'index.js', 'Button.jsx'])
+        max_chunk_size = rng.choice([40, 120, 500])
+        assert chunk_code(code, filename, max_chunk_size) == reference_chunk_code(code, filename, max_chunk_size)
+
+
+def test_chunk_code_covers_every_line():
+    code = '\n'.join(f"const value{i} = {i};" for i in range(200))
+    chunks = chunk_code(code, 'values.ts', max_chunk_size=100)
+
+    assert chunks[0]['start_line'] == 1
+    assert chunks[-1]['end_line'] == 200
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current['start_line'] == previous['end_line'] + 1
+    assert '\n'.join(chunk['text'] for chunk in chunks) == code
+    assert all(chunk['language'] == 'typescript' for chunk in chunks)
+
+
+def test_detect_chunk_type_matches_reference_on_random_inputs():
+    rng = random.Random(1)
+    words = ['useEffect', 'USESTATE', 'function', 'Component', 'class', 'extends',
+             'interface', 'Type', 'export', 'import', 'typeof', 'exported', 'const', 'x']
+    for _ in range(500):
+        code = ' '.join(rng.choice(words) for _ in range(rng.randint(0, 6)))
+        assert detect_chunk_type(code) == reference_detect_chunk_type(code)
+
+
+def encode(text):
+    return base64.b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def test_decode_and_chunk_decodes_base64_content():
+    code = "export default function App() {\n  return null;\n}"
+    chunks = decode_and_chunk({'name': 'App.jsx', 'content': encode(code)})
+
+    assert chunks == chunk_code(code, 'App.jsx')
+    assert chunks[0]['language'] == 'jsx'
+
+
+@pytest.mark.parametrize('file_data', [
+    {'name': 'README.md', 'content': encode('# not code')},
+    {'name': 'empty.ts', 'content': encode('  \n\n ')},
+    {'name': 'broken.ts', 'content': 'not base64!'},
+    {'name': 'binary.ts', 'content': base64.b64encode(b'\xff\xfe\x00').decode('ascii')},
+])
+def test_decode_and_chunk_skips_unusable_files(file_data):
+    assert decode_and_chunk(file_data) == []
@@ -0,0 +1,204 @@
+import threading
+
+import pytest
+
+pytest.importorskip('flask_cors')
+
+import main
+from main import CHARS_PER_TOKEN, trim_to_token_budget
+
+COMPONENT = 'const App = () => null;'
+
+
+def test_trim_to_token_budget_keeps_short_code():
+    code = 'const a = 1;\nconst b = 2;'
+    assert trim_to_token_budget(code, max_tokens=100) is code
+
+
+def test_trim_to_token_budget_cuts_at_line_boundary():
+    code = '\n'.join(f'const line{i} = {i};' for i in range(100))
+    trimmed = trim_to_token_budget(code, max_tokens=50)
+    assert len(trimmed) <= 50 * CHARS_PER_TOKEN
+    assert code.startswith(trimmed)
+    assert code[len(trimmed)] == '\n'
+
+
+def test_trim_to_token_budget_cuts_single_long_line():
+    assert trim_to_token_budget('x' * 1000, max_tokens=10) == 'x' * (10 * CHARS_PER_TOKEN)
+
+
+class LookupCountingDict(dict):
+    """In-flight call table that signals every lookup, so a test knows when
+    concurrent callers have found (or registered) the running call"""
+
+    def __init__(self):
+        super().__init__()
+        self.lookups = threading.Semaphore(0)
+
+    def get(self, key, default=None):
+        value = super().get(key, default)
+        self.lookups.release()
+        return value
+
+
+class FakeMessages:
+    """Anthropic messages API whose calls block until released"""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.release = threading.Event()
+        self.error = error
+
+    def create(self, **kwargs):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+
+        class Usage:
+            input_tokens = 10
+            output_tokens = 20
+
+        class Block:
+            text = 'generated tests'
+
+        class Message:
+            usage = Usage()
+            content = [Block()]
+
+        return Message()
+
+
+class FakeClient:
+    def __init__(self, messages):
+        self.messages = messages
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(main, 'RESPONSE_CACHE_DIR', '')
+    service = main.CursorAIService()
+    service.inflight = LookupCountingDict()
+    return service
+
+
+def generate_concurrently(service, messages, count=4):
+    """Run count identical generations, releasing Claude only once every
+    caller has looked up the in-flight call"""
+    service.anthropic_client = FakeClient(messages)
+    results = [None] * count
+
+    def generate(i):
+        results[i] = service.generate_tests_with_cursor_ai(COMPONENT, f's{i}')
+
+    threads = [threading.Thread(target=generate, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for _ in range(count):
+        assert service.inflight.lookups.acquire(timeout=5)
+    messages.release.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_identical_requests_share_one_claude_call(service):
+    messages = FakeMessages()
+    results = generate_concurrently(service, messages)
+
+    assert messages.calls == 1
+    assert all(result['success'] and result['analysis'] == 'generated tests' for result in results)
+    assert service.inflight == {}
+
+    # Later identical requests are served from the response cache
+    result = service.generate_tests_with_cursor_ai(COMPONENT, 'later')
+    assert result['cached'] is True
+    assert messages.calls == 1
+
+
+def test_single_flight_failure_reaches_every_waiter(service):
+    messages = FakeMessages(error=RuntimeError('overloaded'))
+    results = generate_concurrently(service, messages)
+
+    assert messages.calls == 1
+    assert all(not result['success'] and 'overloaded' in result['error'] for result in results)
+    assert service.inflight == {}
+
+    # Failures are not cached
+    messages.error = None
+    assert service.generate_tests_with_cursor_ai(COMPONENT, 'retry')['success']
+    assert messages.calls == 2
+
+
+@pytest.mark.parametrize('components', [
+    'const App = () => null;',
+    [],
+    ['const App = () => null;', ''],
+    ['const App = () => null;', 3],
+    {'c0': 'const App = () => null;'},
+])
+def test_analyze_batch_rejects_invalid_components(components):
+    response = main.app.test_client().post('/api/cursor/analyze_batch', json={'components': components})
+    assert response.status_code == 400
+
+
+def test_analyze_batch_rejects_too_many_components(monkeypatch):
+    monkeypatch.setattr(main, 'MAX_BATCH_COMPONENTS', 2)
+    response = main.app.test_client().post('/api/cursor/analyze_batch', json={'components': [COMPONENT] * 3})
+    assert response.status_code == 400
+
+
+def test_uncollected_batch_keys_expire(service):
+    class Batches:
+        def create(self, requests):
+            class Batch:
+                id = 'batch_new'
+            return Batch()
+
+    class Messages:
+        batches = Batches()
+
+    service.anthropic_client = FakeClient(Messages())
+    service.batch_cache_keys['batch_old'] = (main.time.monotonic() - main.BATCH_KEY_TTL - 1, {})
+    service.batch_cache_keys['batch_recent'] = (main.time.monotonic(), {})
+
+    service.submit_test_batch([COMPONENT])
+    assert set(service.batch_cache_keys) == {'batch_recent', 'batch_new'}
+    assert set(service.batch_cache_keys['batch_new'][1]) == {'c0'}
+
+
+@pytest.mark.parametrize('session_id', ['../..', 'a/b', '.', 'x' * 65, 'name with spaces', 7])
+def test_invalid_session_ids_are_rejected(session_id):
+    client = main.app.test_client()
+    response = client.post('/api/cursor/analyze', json={'component_code': COMPONENT, 'session_id': session_id})
+    assert response.status_code == 400
+
+
+def test_delete_rejects_invalid_session_id():
+    assert main.app.test_client().delete('/api/cursor/session/..%2F..').status_code in (400, 404)
+    assert main.app.test_client().delete('/api/cursor/session/bad.id').status_code == 400
+
+
+@pytest.fixture
+def workspace_service(tmp_path, monkeypatch):
+    monkeypatch.setenv('CURSOR_WORKSPACE_DIR', str(tmp_path / 'workspaces'))
+    monkeypatch.setattr(main, 'RESPONSE_CACHE_DIR', '')
+    return main.CursorAIService()
+
+
+def test_create_session_keeps_workspaces_under_the_root(workspace_service, tmp_path):
+    with pytest.raises(ValueError):
+        workspace_service.create_session('../escape')
+    assert not (tmp_path / 'escape').exists()
+
+    session_id = workspace_service.create_session('abc_123-XYZ')
+    assert (tmp_path / 'workspaces' / session_id).is_dir()
+
+
+def test_remove_session_never_deletes_outside_the_root(workspace_service, tmp_path):
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    workspace_service.sessions['rogue'] = {'workspace': str(outside), 'last_used': 0}
+
+    assert workspace_service.remove_session('rogue')
+    assert outside.is_dir()
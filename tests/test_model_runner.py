@@ -0,0 +1,95 @@
+import random
+import time
+
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('transformers')
+
+from modules.model_runner import MistralCodeAnalyzer
+
+PIECES = ['## Heading', '**Bold**', '1. Step', '- item', '• dot', 'plain text', 'useEffect(() => {})',
+          '<s>', '</s>', '[INST]', '[/INST]', ' ', '  ', '\t', '\n', '\n\n', ' \n ', '\r\n']
+
+
+@pytest.fixture
+def analyzer():
+    # Built without loading a model; tests attach what they need
+    return MistralCodeAnalyzer.__new__(MistralCodeAnalyzer)
+
+
+def random_splits(rng, text):
+    """text cut into random, possibly empty, pieces"""
+    cuts = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(0, 8)))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_clean_stream_matches_clean_response_on_random_inputs(analyzer):
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 12)))
+        streamed = ''.join(analyzer._clean_stream(iter(random_splits(rng, text))))
+        assert streamed == analyzer._clean_response(text), repr(text)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('', '## Analysis\n\n'),
+    ('<s> [INST] ', '## Analysis\n\n'),
+    ('## Answer\n\n\n  body  </s>', '## Answer\nbody'),
+    ('plain\n \n text', '## Analysis\n\nplain\ntext'),
+])
+def test_clean_response_examples(analyzer, text, expected):
+    assert analyzer._clean_response(text) == expected
+    assert ''.join(analyzer._clean_stream(iter([text]))) == expected
+
+
+class LineTokenizer:
+    """Decodes every token id as its own line"""
+    pad_token_id = 0
+    eos_token_id = 0
+
+    def decode(self, token_ids, **kwargs):
+        return ''.join(f"line {token_id}\n" for token_id in token_ids)
+
+
+class CountingModel:
+    """generate() that streams one token per step and honours stopping
+    criteria"""
+
+    def __init__(self):
+        self.steps = 0
+
+    def generate(self, input_ids, streamer, stopping_criteria, max_new_tokens, **kwargs):
+        streamer.put(input_ids)
+        for step in range(max_new_tokens):
+            input_ids = torch.cat([input_ids, torch.tensor([[step + 1]])], dim=1)
+            self.steps += 1
+            streamer.put(input_ids[:, -1])
+            if stopping_criteria(input_ids, None).all():
+                break
+            time.sleep(0.001)
+        streamer.end()
+
+
+@pytest.fixture
+def streaming_analyzer(analyzer, monkeypatch):
+    analyzer.model = CountingModel()
+    analyzer.tokenizer = LineTokenizer()
+    analyzer.static_cache = None
+    monkeypatch.setattr(analyzer, '_prepare_inputs', lambda *args: {'input_ids': torch.tensor([[0]])})
+    return analyzer
+
+
+def test_stream_response_yields_generated_lines(streaming_analyzer):
+    streamed = ''.join(streaming_analyzer.stream_response('q', 'context', max_tokens=3))
+    assert streamed == '## Analysis\n\nline 1\nline 2\nline 3'
+
+
+def test_closing_stream_response_cancels_generation(streaming_analyzer):
+    stream = streaming_analyzer.stream_response('q', 'context', max_tokens=100000)
+    assert next(stream) == '## Analysis\n\nline 1'
+
+    started = time.monotonic()
+    stream.close()
+    assert time.monotonic() - started < 5
+    assert streaming_analyzer.model.steps < 100000
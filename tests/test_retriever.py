@@ -1 +1,135 @@
- 
+import random
+import sys
+import types
+
+import pytest
+
+from modules.retriever import CodeRetriever
+
+WORDS = ['useEffect', 'usestate', 'infinite', 'loop', 'render', 're-render', 'type', 'Interface',
+         'generic', 'hook', 'component', 'dependency', 'why', 'does', 'my', 'my', 'the', '']
+
+
+def reference_enhance_query(query):
+    """Query expansion as originally written"""
+    enhanced_queries = [query]
+    query_lower = query.lower()
+    if 'useeffect' in query_lower:
+        enhanced_queries.extend([query + ' dependency array', query + ' cleanup function', 'useEffect infinite loop'])
+    if 'usestate' in query_lower:
+        enhanced_queries.extend([query + ' state update', query + ' functional update', 'useState asynchronous'])
+    if 'infinite' in query_lower or 'loop' in query_lower:
+        enhanced_queries.extend(['useEffect dependency array', 'missing dependencies', 'useCallback memoization'])
+    if 'render' in query_lower:
+        enhanced_queries.extend(['React.memo optimization', 'useMemo performance', 'unnecessary re-render'])
+    if any(ts_term in query_lower for ts_term in ['type', 'interface', 'generic']):
+        enhanced_queries.extend([query + ' TypeScript', query + ' type definition'])
+    return enhanced_queries
+
+
+def reference_relevance(query, chunk):
+    """Relevance score as originally written"""
+    score = 0.0
+    query_lower = query.lower()
+    chunk_text = chunk['text'].lower()
+    chunk_type = chunk['metadata'].get('type', '')
+    for word in query_lower.split():
+        if word in chunk_text:
+            score += 1.0
+    if 'useeffect' in query_lower and 'useeffect' in chunk_text:
+        score += 2.0
+    if 'usestate' in query_lower and 'usestate' in chunk_text:
+        score += 2.0
+    if 'infinite' in query_lower and ('dependency' in chunk_text or 'useeffect' in chunk_text):
+        score += 1.5
+    if chunk_type == 'react_hook' and any(hook in query_lower for hook in ['hook', 'useeffect', 'usestate']):
+        score += 1.0
+    if chunk_type == 'react_component' and 'component' in query_lower:
+        score += 1.0
+    if chunk_type == 'typescript_definition' and any(ts_term in query_lower for ts_term in ['type', 'interface']):
+        score += 1.0
+    return score
+
+
+def random_text(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, count)))
+
+
+def random_chunk(rng):
+    return {
+        'text': random_text(rng, 12),
+        'metadata': {'type': rng.choice(['react_hook', 'react_component', 'typescript_definition', 'code_block'])}
+    }
+
+
+def test_enhance_query_matches_reference_on_random_inputs():
+    retriever = CodeRetriever()
+    rng = random.Random(0)
+    for _ in range(500):
+        query = random_text(rng, 6)
+        assert retriever.enhance_query(query) == reference_enhance_query(query)
+
+
+def test_enhance_query_returns_a_fresh_list():
+    retriever = CodeRetriever()
+    retriever.enhance_query('useEffect loop').append('mutated')
+    assert 'mutated' not in retriever.enhance_query('useEffect loop')
+
+
+def test_score_chunk_matches_reference_on_random_inputs():
+    retriever = CodeRetriever()
+    rng = random.Random(1)
+    for _ in range(200):
+        query = random_text(rng, 6)
+        terms = retriever._query_terms(query)
+        for _ in range(10):
+            chunk = random_chunk(rng)
+            assert retriever._score_chunk(terms, chunk) == reference_relevance(query, chunk)
+            assert retriever._calculate_relevance(query, chunk) == reference_relevance(query, chunk)
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.generation = 0
+        self.searches = 0
+
+    def search_similar_chunks_batch(self, queries, session_id, top_k):
+        self.searches += 1
+        return [[
+            {'text': 'useEffect(() => {}, [])', 'filename': 'App.tsx', 'start_line': 1,
+             'distance': 0.2, 'metadata': {'type': 'react_hook'}},
+            {'text': 'const x = 1;', 'filename': 'util.ts', 'start_line': 4,
+             'distance': 0.1, 'metadata': {'type': 'code_block'}},
+        ] for _ in queries]
+
+
+@pytest.fixture
+def vector_store(monkeypatch):
+    store = FakeVectorStore()
+    module = types.ModuleType('modules.chromadb_store')
+    module.get_vector_store = lambda: store
+    monkeypatch.setitem(sys.modules, 'modules.chromadb_store', module)
+    return store
+
+
+def test_retrieval_cache_returns_copies(vector_store):
+    retriever = CodeRetriever()
+    first = retriever.retrieve_relevant_chunks('useEffect loop', 's1')
+    assert [chunk['filename'] for chunk in first] == ['App.tsx', 'util.ts']
+
+    first[0]['text'] = 'mutated'
+    second = retriever.retrieve_relevant_chunks('  USEEFFECT   loop ', 's1')
+    assert vector_store.searches == 1
+    assert second[0]['text'] == 'useEffect(() => {}, [])'
+    assert second[0] is not first[0]
+
+
+def test_retrieval_cache_misses_after_store_changes(vector_store):
+    retriever = CodeRetriever()
+    retriever.retrieve_relevant_chunks('useEffect loop', 's1')
+    retriever.retrieve_relevant_chunks('useEffect loop', 's2')
+    assert vector_store.searches == 2
+
+    vector_store.generation += 1
+    retriever.retrieve_relevant_chunks('useEffect loop', 's1')
+    assert vector_store.searches == 3